@@ -75,7 +75,7 @@ cd ../..
 # Start AI Agent
 print_status "Starting Pydantic AI Agent on port 8001..."
 cd services/claims-ai-engine
-poetry run python src/ag_ui_agent.py > ../../logs/ai-agent.log 2>&1 &
+UVICORN_RELOAD=true poetry run python src/ag_ui_agent.py > ../../logs/ai-agent.log 2>&1 &
 AI_AGENT_PID=$!
 cd ../..
 
@@ -1,5 +1,5 @@
 """Audit logging utilities for PHI-safe tracking."""
 
-from .client import audit_log
+from .client import audit_dropped_count, audit_log, flush_audit_log
 
-__all__ = ["audit_log"]
+__all__ = ["audit_dropped_count", "audit_log", "flush_audit_log"]
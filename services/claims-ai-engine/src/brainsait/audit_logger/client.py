@@ -1,15 +1,206 @@
 """Centralized audit logging client (PHI-safe, structured)."""
 from __future__ import annotations
 
+import asyncio
+from contextlib import suppress
 from datetime import datetime
-import json
+import logging
 import os
-from typing import Any, Dict, Optional
+import sys
+import threading
+import time
+from typing import Any, Awaitable, Dict, Iterator, List, Optional, Tuple
+
+import orjson
 
 AUDIT_SINK = os.getenv("AUDIT_SINK", "stdout")
+AUDIT_BATCH_MAX = int(os.getenv("AUDIT_BATCH_MAX", "100"))
+AUDIT_BATCH_WAIT_MS = float(os.getenv("AUDIT_BATCH_WAIT_MS", "50"))
+# Pending-record bound. When the queue is full, AUDIT_OVERFLOW decides:
+# "drop_oldest" (default) evicts the oldest pending record to cap memory and
+# latency; "write_through" writes the new record synchronously instead, so no
+# record is lost at the cost of blocking the caller on sink I/O.
+AUDIT_QUEUE_MAX = int(os.getenv("AUDIT_QUEUE_MAX", "10000"))
+AUDIT_OVERFLOW = os.getenv("AUDIT_OVERFLOW", "drop_oldest")
+AUDIT_LOG_PATH = os.getenv("AUDIT_LOG_PATH", "audit.log")  # used when AUDIT_SINK=file
+
+# writev() accepts at most IOV_MAX buffers per call
+_IOV_MAX = os.sysconf("SC_IOV_MAX") if hasattr(os, "sysconf") else 1024
+
+logger = logging.getLogger(__name__)
+
+_queue: Optional[asyncio.Queue[Dict[str, Any]]] = None
+_writer: Optional[asyncio.Task[None]] = None
+_file_fd: Optional[int] = None
+_file_lock = threading.Lock()
+_dropped = 0
+_ts_cache: Tuple[int, str] = (-1, "")
+
+
+def _utc_timestamp() -> str:
+    """UTC ISO-8601 timestamp at second resolution, formatted once per second."""
+
+    global _ts_cache
+    now = int(time.time())
+    if now != _ts_cache[0]:
+        _ts_cache = (now, datetime.utcfromtimestamp(now).isoformat())
+    return _ts_cache[1]
+
+
+def _writer_queue() -> asyncio.Queue[Dict[str, Any]]:
+    """Return the pending-record queue, starting the background writer if needed."""
+
+    global _queue, _writer
+    loop = asyncio.get_running_loop()
+    if _queue is None or _writer is None or _writer.get_loop() is not loop:
+        _queue = asyncio.Queue(maxsize=AUDIT_QUEUE_MAX)
+        _writer = loop.create_task(_drain_loop(_queue))
+    elif _writer.done():
+        _writer = loop.create_task(_drain_loop(_queue))
+    return _queue
+
+
+async def _drain_loop(queue: asyncio.Queue[Dict[str, Any]]) -> None:
+    """Collect up to AUDIT_BATCH_MAX records or AUDIT_BATCH_WAIT_MS, then write once."""
+
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await queue.get()]
+        deadline = loop.time() + AUDIT_BATCH_WAIT_MS / 1000
+        while len(batch) < AUDIT_BATCH_MAX:
+            try:
+                batch.append(queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        try:
+            await _write_batch(batch)
+        except Exception:  # noqa: BLE001 - never let the writer die
+            logger.exception("Failed to write %d audit records", len(batch))
+        finally:
+            for _ in batch:
+                queue.task_done()
+
+
+def _serialize(record: Dict[str, Any]) -> bytes:
+    return orjson.dumps(record, default=str, option=orjson.OPT_APPEND_NEWLINE)
+
+
+async def _write_batch(records: List[Dict[str, Any]]) -> None:
+    """Serialize a batch as JSON lines and emit it with a single write."""
+
+    lines = [_serialize(record) for record in records]
+    if AUDIT_SINK == "file":
+        # Blocking disk I/O stays off the event loop
+        await asyncio.to_thread(_write_file, lines)
+    elif AUDIT_SINK == "stdout":
+        _write_stdout(b"".join(lines))
+    else:
+        # TODO: send to external audit-service sink
+        _write_stdout(b"".join(lines))
+
+
+def _write_now(record: Dict[str, Any]) -> None:
+    """Write one record synchronously (no event loop, or write-through overflow)."""
+
+    line = _serialize(record)
+    if AUDIT_SINK == "file":
+        _write_file([line])
+    else:
+        _write_stdout(line)
 
 
-async def audit_log(
+def _audit_fd() -> int:
+    global _file_fd
+    # Records written synchronously may come from other threads
+    with _file_lock:
+        if _file_fd is None:
+            _file_fd = os.open(
+                AUDIT_LOG_PATH, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600
+            )
+        return _file_fd
+
+
+def _write_file(lines: List[bytes]) -> None:
+    """Append records to AUDIT_LOG_PATH with one writev() per IOV_MAX lines."""
+
+    fd = _audit_fd()
+    for start in range(0, len(lines), _IOV_MAX):
+        chunk = lines[start : start + _IOV_MAX]
+        written = os.writev(fd, chunk)
+        pending = sum(map(len, chunk)) - written
+        if pending:  # short write (e.g. disk nearly full): finish the tail
+            rest = memoryview(b"".join(chunk))[written:]
+            while rest:
+                rest = rest[os.write(fd, rest) :]
+
+
+def _write_stdout(data: bytes) -> None:
+    buffer = getattr(sys.stdout, "buffer", None)
+    if buffer is None:  # stdout replaced by a text-only stream (e.g. test capture)
+        sys.stdout.write(data.decode())
+        sys.stdout.flush()
+        return
+    buffer.write(data)
+    buffer.flush()
+
+
+def _enqueue(record: Dict[str, Any]) -> None:
+    """Queue a record; on overflow apply AUDIT_OVERFLOW."""
+
+    global _dropped
+    try:
+        queue = _writer_queue()
+    except RuntimeError:  # no running event loop (sync code, worker threads)
+        _write_now(record)
+        return
+    try:
+        queue.put_nowait(record)
+        return
+    except asyncio.QueueFull:
+        pass
+    if AUDIT_OVERFLOW == "write_through":
+        _write_now(record)
+        return
+    queue.get_nowait()
+    queue.task_done()
+    queue.put_nowait(record)
+    _dropped += 1
+    if _dropped % 1000 == 1:
+        logger.warning(
+            "Audit queue full (%d records); %d oldest records dropped so far",
+            AUDIT_QUEUE_MAX,
+            _dropped,
+        )
+
+
+def audit_dropped_count() -> int:
+    """Number of audit records dropped so far because the queue was full."""
+
+    return _dropped
+
+
+class _Queued:
+    """Result of ``audit_log``; awaiting it is a no-op kept for older callers."""
+
+    __slots__ = ()
+
+    def __await__(self) -> Iterator[None]:
+        return iter(())
+
+
+_QUEUED = _Queued()
+
+
+def audit_log(
     *,
     action: str,
     user_id: str,
@@ -17,16 +208,23 @@ async def audit_log(
     resource_id: str,
     phi_involved: bool,
     meta: Optional[Dict[str, Any]] = None,
-) -> None:
+) -> Awaitable[None]:
     """Emit a structured audit log entry.
 
-    In production deployments the sink should forward to a durable audit
-    service (HTTP/gRPC/Kafka). For now we default to stdout to maintain
-    transparency during development.
+    Fire-and-forget: inside a running event loop, records are queued and
+    written in batches by a background task, so callers never wait on sink
+    I/O; without one (sync code, worker threads) the record is written
+    synchronously. The record is emitted by the call itself, so ``await`` is
+    unnecessary, but still accepted for callers of the former coroutine. The
+    queue holds at most AUDIT_QUEUE_MAX records; see AUDIT_OVERFLOW for the
+    overload policy and ``audit_dropped_count`` for records lost to it. In
+    production deployments the sink should forward to a durable audit service
+    (HTTP/gRPC/Kafka). For now we default to stdout to maintain transparency
+    during development.
     """
 
     record = {
-        "ts": datetime.utcnow().isoformat(),
+        "ts": _utc_timestamp(),
         "action": action,
         "user_id": user_id,
         "resource_type": resource_type,
@@ -34,10 +232,27 @@ async def audit_log(
         "phi_involved": phi_involved,
         "meta": meta or {},
     }
+    _enqueue(record)
+    return _QUEUED
 
-    line = json.dumps(record, ensure_ascii=False)
-    if AUDIT_SINK == "stdout":
-        print(line, flush=True)
-    else:
-        # TODO: send to external audit-service sink
-        print(line, flush=True)
+
+async def flush_audit_log() -> None:
+    """Wait for every queued audit record to be written, then stop the writer."""
+
+    global _writer
+    if _queue is None or _writer is None:
+        return
+    if not _writer.done():
+        await _queue.join()
+        _writer.cancel()
+        with suppress(asyncio.CancelledError):
+            await _writer
+    _writer = None
+    _close_file()
+
+
+def _close_file() -> None:
+    global _file_fd
+    if _file_fd is not None:
+        os.close(_file_fd)
+        _file_fd = None
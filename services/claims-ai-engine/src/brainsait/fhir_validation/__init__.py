@@ -1,5 +1,5 @@
 """FHIR validation helpers."""
 
-from .validator import validate_fhir_claim_bundle
+from .validator import validate_fhir_claim_bundle, validate_fhir_claim_bundles
 
-__all__ = ["validate_fhir_claim_bundle"]
+__all__ = ["validate_fhir_claim_bundle", "validate_fhir_claim_bundles"]
@@ -1,29 +1,68 @@
 """Lightweight FHIR R4 validation helpers."""
 from __future__ import annotations
 
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, List, Sequence, Tuple
 
+import numpy as np
 
-def validate_fhir_claim_bundle(bundle: Dict[str, Any]) -> Tuple[bool, List[str]]:
-    """Validate a minimal FHIR Claim bundle (stubbed rules)."""
+# Column order of the per-bundle rule flags and the error each failed rule reports.
+_RULE_ERRORS = (
+    "Bundle.resourceType must be 'Bundle'",
+    "Bundle.entry is required",
+    "Bundle must include a Claim resource",
+)
 
-    errors: List[str] = []
 
-    if not bundle or bundle.get("resourceType") != "Bundle":
-        errors.append("Bundle.resourceType must be 'Bundle'")
+def _bundle_flags(bundle: Dict[str, Any]) -> Tuple[bool, bool, bool]:
+    """Evaluate each stub rule for one bundle: (is_bundle, has_entry, has_claim)."""
+
+    if not bundle:
+        return False, False, False
 
     entries = bundle.get("entry", [])
-    if not entries:
-        errors.append("Bundle.entry is required")
+    has_claim = False
+    for entry in entries:
+        resource = entry.get("resource")
+        if resource is not None and resource.get("resourceType") == "Claim":
+            has_claim = True
+            break  # well-formed bundles usually carry the Claim first
+
+    return (
+        bundle.get("resourceType") == "Bundle",
+        bool(entries),
+        has_claim,
+    )
+
+
+def _errors_for(flags: Sequence[bool]) -> List[str]:
+    return [error for passed, error in zip(flags, _RULE_ERRORS) if not passed]
+
 
-    resource_types = {
-        entry.get("resource", {}).get("resourceType")
-        for entry in entries
-        if "resource" in entry
-    }
-    if "Claim" not in resource_types:
-        errors.append("Bundle must include a Claim resource")
+def validate_fhir_claim_bundle(bundle: Dict[str, Any]) -> Tuple[bool, List[str]]:
+    """Validate a minimal FHIR Claim bundle (stubbed rules)."""
 
+    errors = _errors_for(_bundle_flags(bundle))
     if errors:
         return False, errors
     return True, []
+
+
+def validate_fhir_claim_bundles(
+    bundles: Sequence[Dict[str, Any]],
+) -> List[Tuple[bool, List[str]]]:
+    """Validate many bundles at once (bulk re-validation of stored claims).
+
+    Rule flags are extracted into an ``(n, rules)`` int8 matrix and the valid
+    mask is computed in one vectorized pass; error lists are only built for
+    the bundles that fail.
+    """
+
+    flags = np.array(
+        [_bundle_flags(bundle) for bundle in bundles], dtype=np.int8
+    ).reshape(len(bundles), len(_RULE_ERRORS))
+    valid = flags.all(axis=1)
+
+    results: List[Tuple[bool, List[str]]] = []
+    for ok, row in zip(valid.tolist(), flags.tolist()):
+        results.append((True, []) if ok else (False, _errors_for(row)))
+    return results
@@ -1,11 +1,22 @@
-"""HIPAA and NPHIES decorators and crypto helpers."""
+"""HIPAA and NPHIES decorators, middleware and crypto helpers."""
 
-from .decorators import ComplianceError, hipaa_compliant
-from .crypto import decrypt_phi, encrypt_phi
+from .decorators import (
+    ComplianceError,
+    get_runtime_compliance_check,
+    hipaa_compliant,
+    register_runtime_compliance_check,
+)
+from .crypto import decrypt_phi, encrypt_phi, encrypt_phi_many
+from .middleware import PHI_ROUTE_KEY, HIPAAAuditMiddleware
 
 __all__ = [
     "ComplianceError",
+    "get_runtime_compliance_check",
     "hipaa_compliant",
+    "HIPAAAuditMiddleware",
+    "PHI_ROUTE_KEY",
+    "register_runtime_compliance_check",
     "encrypt_phi",
+    "encrypt_phi_many",
     "decrypt_phi",
 ]
@@ -1,12 +1,14 @@
 """AES-256-GCM utilities for PHI field encryption/decryption."""
 from __future__ import annotations
 
+from functools import lru_cache
 import os
-from typing import Tuple
+from typing import List, Sequence, Tuple
 
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 
 
+@lru_cache(maxsize=1)
 def _key_from_env() -> bytes:
     key_hex = os.getenv("PHI_AES256_KEY_HEX", "")
     try:
@@ -19,19 +21,34 @@ def _key_from_env() -> bytes:
     return key
 
 
+@lru_cache(maxsize=1)
+def _get_cipher() -> AESGCM:
+    """Process-wide cipher; clear both caches (this and the key) after key rotation."""
+
+    return AESGCM(_key_from_env())
+
+
 def encrypt_phi(plaintext: bytes, *, aad: bytes = b"brainsait") -> Tuple[bytes, bytes]:
     """Encrypt PHI payloads using AES-256-GCM."""
 
-    key = _key_from_env()
-    aesgcm = AESGCM(key)
     nonce = os.urandom(12)
-    ciphertext = aesgcm.encrypt(nonce, plaintext, aad)
-    return nonce, ciphertext
+    return nonce, _get_cipher().encrypt(nonce, plaintext, aad)
+
+
+def encrypt_phi_many(
+    plaintexts: Sequence[bytes], *, aad: bytes = b"brainsait"
+) -> List[Tuple[bytes, bytes]]:
+    """Encrypt many PHI fields with one cipher instance (bulk imports/exports)."""
+
+    encrypt = _get_cipher().encrypt
+    results = []
+    for plaintext in plaintexts:
+        nonce = os.urandom(12)
+        results.append((nonce, encrypt(nonce, plaintext, aad)))
+    return results
 
 
 def decrypt_phi(nonce: bytes, ciphertext: bytes, *, aad: bytes = b"brainsait") -> bytes:
     """Decrypt PHI payloads using AES-256-GCM."""
 
-    key = _key_from_env()
-    aesgcm = AESGCM(key)
-    return aesgcm.decrypt(nonce, ciphertext, aad)
+    return _get_cipher().decrypt(nonce, ciphertext, aad)
@@ -1,9 +1,8 @@
 """HIPAA/NPHIES compliance decorators for FastAPI endpoints."""
 from __future__ import annotations
 
-import asyncio
 from functools import wraps
-from typing import Any, Awaitable, Callable
+from typing import Any, Awaitable, Callable, Optional
 
 from src.brainsait.audit_logger import audit_log
 
@@ -12,15 +11,29 @@ class ComplianceError(Exception):
     """Raised when HIPAA/NPHIES compliance checks fail."""
 
 
-async def _validate_runtime_compliance() -> None:
-    """Placeholder for runtime compliance checks.
+# Runtime compliance check awaited before every decorated call; None (the default)
+# means there is nothing to check, so the wrapper skips the await entirely.
+_runtime_check: Optional[Callable[[], Awaitable[None]]] = None
+
+
+def register_runtime_compliance_check(
+    check: Optional[Callable[[], Awaitable[None]]],
+) -> None:
+    """Install (or clear, with ``None``) the runtime compliance check.
 
     In production this should verify encryption keys, audit sinks, RBAC, and
-    TLS enforcement. Keeping the async signature allows expanding without
-    breaking the decorator contract.
+    TLS enforcement, raising ``ComplianceError`` on failure. Endpoints that
+    were decorated earlier pick the check up on their next call.
     """
 
-    return None
+    global _runtime_check
+    _runtime_check = check
+
+
+def get_runtime_compliance_check() -> Optional[Callable[[], Awaitable[None]]]:
+    """Return the installed runtime compliance check, or ``None`` if there is none."""
+
+    return _runtime_check
 
 
 def hipaa_compliant(
@@ -29,18 +42,23 @@ def hipaa_compliant(
     """Decorator enforcing HIPAA guardrails and audit scaffolding."""
 
     def decorator(func: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+        func_name = getattr(func, "__name__", "unknown")
+
         @wraps(func)
         async def wrapper(*args: Any, **kwargs: Any) -> Any:
-            await _validate_runtime_compliance()
+            if _runtime_check is not None:
+                await _runtime_check()
             try:
                 return await func(*args, **kwargs)
             except Exception as exc:  # noqa: BLE001 - audit all errors
                 user = kwargs.get("user")
-                await audit_log(
+                # audit_log only queues the record, so the error reaches the
+                # client immediately.
+                audit_log(
                     action="exception",
                     user_id=getattr(user, "id", "unknown"),
                     resource_type="API",
-                    resource_id=getattr(func, "__name__", "unknown"),
+                    resource_id=func_name,
                     phi_involved=audit_phi,
                     meta={"error": str(exc)[:200]},
                 )
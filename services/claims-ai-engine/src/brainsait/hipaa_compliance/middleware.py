@@ -0,0 +1,94 @@
+"""ASGI middleware applying HIPAA guardrails to tagged routes."""
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional, Tuple
+
+from starlette.routing import BaseRoute, Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.brainsait.audit_logger import audit_log
+from src.brainsait.hipaa_compliance.decorators import get_runtime_compliance_check
+
+# Routes opt in with ``openapi_extra={PHI_ROUTE_KEY: audit_phi}``.
+PHI_ROUTE_KEY = "x-hipaa-phi"
+
+
+class HIPAAAuditMiddleware:
+    """Run the runtime compliance check and audit failures of tagged routes.
+
+    Tagged routes are collected from the app once, on the first request;
+    untagged routes pass straight through. Unhandled exceptions are audited
+    as ``"exception"``, as the ``hipaa_compliant`` decorator did; error
+    responses (status >= 400, e.g. from ``HTTPException``, auth dependencies
+    or request validation) as ``"error_response"``. The acting user is read
+    from ``request.state.user`` (set by ``get_current_user``).
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+        self._routes: Optional[List[Tuple[BaseRoute, str, bool]]] = None
+
+    def _tagged_routes(self, scope: Scope) -> List[Tuple[BaseRoute, str, bool]]:
+        if self._routes is None:
+            routes = []
+            for route in scope["app"].routes:
+                extra = getattr(route, "openapi_extra", None) or {}
+                if PHI_ROUTE_KEY in extra:
+                    routes.append(
+                        (
+                            route,
+                            getattr(route, "name", "unknown"),
+                            bool(extra[PHI_ROUTE_KEY]),
+                        )
+                    )
+            self._routes = routes
+        return self._routes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        for route, name, audit_phi in self._tagged_routes(scope):
+            match, _ = route.matches(scope)
+            if match is Match.FULL:
+                break
+        else:
+            await self.app(scope, receive, send)
+            return
+
+        runtime_check = get_runtime_compliance_check()
+        if runtime_check is not None:
+            await runtime_check()
+
+        status = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        except Exception as exc:  # noqa: BLE001 - audit all errors
+            _audit_failure(
+                scope, "exception", name, audit_phi, {"error": str(exc)[:200]}
+            )
+            raise
+        if status >= 400:
+            _audit_failure(scope, "error_response", name, audit_phi, {"status": status})
+
+
+def _audit_failure(
+    scope: Scope, action: str, name: str, audit_phi: bool, meta: Dict[str, Any]
+) -> None:
+    user = scope.get("state", {}).get("user")
+    audit_log(
+        action=action,
+        user_id=getattr(user, "id", "unknown"),
+        resource_type="API",
+        resource_id=name,
+        phi_involved=audit_phi,
+        meta=meta,
+    )
@@ -1,5 +1,5 @@
 """NPHIES domain helpers."""
 
-from .validators import validate_saudi_patient_id
+from .validators import validate_saudi_patient_id, validate_saudi_patient_ids
 
-__all__ = ["validate_saudi_patient_id"]
+__all__ = ["validate_saudi_patient_id", "validate_saudi_patient_ids"]
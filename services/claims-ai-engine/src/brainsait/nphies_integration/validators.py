@@ -1,14 +1,46 @@
 """Saudi NPHIES format checks (ID/Iqama)."""
 from __future__ import annotations
 
-import re
+from functools import lru_cache
+from typing import Optional, Sequence
 
-_SA_ID = re.compile(r"^[12]\d{9}$")  # 10 digits starting with 1 or 2
+import numpy as np
 
+_ID_LEN = 10  # 10 digits starting with 1 (citizen) or 2 (resident/Iqama)
 
+
+@lru_cache(maxsize=131072)  # eligibility checks repeat the same IDs constantly
 def validate_saudi_patient_id(value: str | None) -> bool:
     """Validate Saudi National ID/Iqama format (syntactic check only)."""
 
-    if value is None:
-        return False
-    return bool(_SA_ID.match(value))
+    return (
+        value is not None
+        and len(value) == _ID_LEN
+        and value[0] in "12"
+        and value.isascii()
+        and value.isdigit()
+    )
+
+
+def validate_saudi_patient_ids(values: Sequence[Optional[str]]) -> np.ndarray:
+    """Vectorized ``validate_saudi_patient_id`` for bulk claim imports.
+
+    Well-formed candidates are packed into one contiguous ``uint8`` buffer and
+    checked with whole-array byte comparisons; returns a boolean mask aligned
+    with ``values``.
+    """
+
+    count = len(values)
+    shaped = np.fromiter(
+        (v is not None and len(v) == _ID_LEN and v.isascii() for v in values),
+        dtype=bool,
+        count=count,
+    )
+    filler = b"\0" * _ID_LEN
+    packed = b"".join(
+        v.encode("ascii") if ok else filler for v, ok in zip(values, shaped)
+    )
+    digits = np.frombuffer(packed, dtype=np.uint8).reshape(count, _ID_LEN)
+    all_digits = ((digits >= ord("0")) & (digits <= ord("9"))).all(axis=1)
+    leading = (digits[:, 0] == ord("1")) | (digits[:, 0] == ord("2"))
+    return shaped & all_digits & leading
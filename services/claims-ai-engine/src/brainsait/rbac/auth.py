@@ -3,7 +3,7 @@ from __future__ import annotations
 
 from typing import Callable, List
 
-from fastapi import Depends, HTTPException
+from fastapi import Depends, HTTPException, Request
 from pydantic import BaseModel
 
 from src.brainsait.rbac.roles import ROLES_TO_SCOPES
@@ -15,16 +15,19 @@ class User(BaseModel):
     scopes: List[str]
 
 
-def get_current_user() -> User:
+def get_current_user(request: Request) -> User:
     """Stub current user provider.
 
     Replace with JWT/OIDC extraction in production. Defaults to an insurer
-    analyst to keep demo flows unblocked while RBAC is wired through.
+    analyst to keep demo flows unblocked while RBAC is wired through. The
+    user is also stored on ``request.state`` for the HIPAA audit middleware.
     """
 
     role = "insurer_analyst"
     scopes = ROLES_TO_SCOPES.get(role, [])
-    return User(id="user-001", role=role, scopes=scopes)
+    user = User(id="user-001", role=role, scopes=scopes)
+    request.state.user = user
+    return user
 
 
 def require_scope(required: List[str]) -> Callable[[User], None]:
@@ -1,31 +1,112 @@
 """FastAPI service combining AI endpoints and compliance-ready APIs."""
 from __future__ import annotations
 
+import atexit
+import hashlib
 import logging
 import os
+import queue
+import secrets
 import time
-from typing import Any, Dict
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, AsyncIterator, Dict, Generic, List, Optional, Tuple, TypeVar
 
+import aiofiles
+import orjson
 import uvicorn
-from fastapi import Depends, FastAPI, File, HTTPException, UploadFile
+from fastapi import Depends, FastAPI, File, HTTPException, Request, UploadFile
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter, ValidationError
 from prometheus_fastapi_instrumentator import Instrumentator
 
-from src.brainsait.audit_logger import audit_log
-from src.brainsait.fhir_validation import validate_fhir_claim_bundle
-from src.brainsait.hipaa_compliance import hipaa_compliant
+from src.brainsait.audit_logger import (
+    audit_dropped_count,
+    audit_log,
+    flush_audit_log,
+)
+from src.brainsait.fhir_validation import (
+    validate_fhir_claim_bundle,
+    validate_fhir_claim_bundles,
+)
+from src.brainsait.hipaa_compliance import PHI_ROUTE_KEY, HIPAAAuditMiddleware
 from src.brainsait.nphies_integration import validate_saudi_patient_id
 from src.brainsait.rbac import User, get_current_user, require_scope
 
-# Configure logging early so importers inherit handlers.
-logging.basicConfig(level=logging.INFO)
+# Configure logging early so importers inherit handlers. Request paths only
+# enqueue records; a listener thread, started together with the handler and
+# stopped (draining the queue) at interpreter exit, does the I/O.
+_log_queue: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+# QueueHandler.prepare() applies basicConfig's format, so the stream handler
+# writes the already-formatted message as-is.
+_log_listener = QueueListener(
+    _log_queue, logging.StreamHandler(), respect_handler_level=True
+)
+logging.basicConfig(level=logging.INFO, handlers=[QueueHandler(_log_queue)])
+_log_listener.start()
+atexit.register(_log_listener.stop)
 logger = logging.getLogger(__name__)
 
+# Uploaded source files are streamed here in fixed-size chunks.
+UPLOAD_DIR = os.getenv("INGESTION_UPLOAD_DIR", "uploads")
+UPLOAD_CHUNK_SIZE = 1 << 20  # 1 MiB
+
+_V = TypeVar("_V")
+
+
+class _LRUCache(Generic[_V]):
+    """Small bounded LRU map for memoizing pure validation results."""
+
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self._entries: OrderedDict[str, _V] = OrderedDict()
+
+    def get(self, key: str) -> Optional[_V]:
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: _V) -> None:
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+
+# Bundle validation results keyed by a hash of the canonical (sorted-key) JSON.
+_bundle_validation_cache: _LRUCache[Tuple[bool, List[str]]] = _LRUCache(maxsize=4096)
+
+
+def _validate_bundle_cached(bundle: Dict[str, Any]) -> Tuple[bool, List[str]]:
+    key = hashlib.blake2b(
+        orjson.dumps(bundle, option=orjson.OPT_SORT_KEYS), digest_size=16
+    ).hexdigest()
+    result = _bundle_validation_cache.get(key)
+    if result is None:
+        result = validate_fhir_claim_bundle(bundle)
+        _bundle_validation_cache.set(key, result)
+    return result
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """Prepare the uploads dir; flush the audit log on exit."""
+
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    yield
+    await flush_audit_log()
+
+
 app = FastAPI(
     title="BrainSAIT Claims AI Engine",
     description="AI-powered claims processing with HIPAA/NPHIES guardrails",
     version="1.1.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
 Instrumentator().instrument(app).expose(app, include_in_schema=False)
@@ -39,8 +120,18 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Runtime compliance check and failure auditing for routes tagged with
+# openapi_extra={PHI_ROUTE_KEY: audit_phi}.
+app.add_middleware(HIPAAAuditMiddleware)
 
-class ClaimRequest(BaseModel):
+
+class _FrozenModel(BaseModel):
+    """Immutable API model; unknown fields are ignored rather than stored."""
+
+    model_config = ConfigDict(extra="ignore", frozen=True)
+
+
+class ClaimRequest(_FrozenModel):
     claim_id: str
     patient_id: str
     provider_id: str
@@ -50,7 +141,7 @@ class ClaimRequest(BaseModel):
     claim_data: Dict[str, Any]
 
 
-class ClaimResponse(BaseModel):
+class ClaimResponse(_FrozenModel):
     claim_id: str
     decision: str  # "approved", "denied", "review"
     confidence: float
@@ -58,18 +149,18 @@ class ClaimResponse(BaseModel):
     processing_time_ms: int
 
 
-class IngestionMeta(BaseModel):
+class IngestionMeta(_FrozenModel):
     locale: str = Field("ar", pattern="^(ar|en)$")
     payerId: str | None = None
     providerId: str | None = None
 
 
-class IngestionResponse(BaseModel):
+class IngestionResponse(_FrozenModel):
     fileId: str
     status: str
 
 
-class KPIResponse(BaseModel):
+class KPIResponse(_FrozenModel):
     rejectionCount: int
     rejectionAmount: float
     topCategories: list[str]
@@ -77,22 +168,30 @@ class KPIResponse(BaseModel):
     adr: float = Field(..., description="Avoidable Denial Rate")
 
 
-class EligibilityRequest(BaseModel):
+class EligibilityRequest(_FrozenModel):
     patient: dict
     coverageId: str | None = None
     serviceDate: str | None = None  # ISO date
 
 
-class EligibilityResponse(BaseModel):
+class EligibilityResponse(_FrozenModel):
     eligible: bool
     reasons: list[str]
     coverageSummary: dict | None = None
 
 
-class ClaimBundleRequest(BaseModel):
+class ClaimBundleRequest(_FrozenModel):
     bundle: dict
 
 
+class BundleValidationResult(_FrozenModel):
+    valid: bool
+    errors: list[str]
+
+
+_ClaimBundleBatch = TypeAdapter(List[Dict[str, Any]])
+
+
 @app.get("/health")
 async def health_check() -> Dict[str, Any]:
     """Service health probe with compliance-aware metadata."""
@@ -103,6 +202,7 @@ async def health_check() -> Dict[str, Any]:
         "version": app.version,
         "ml_models_loaded": True,
         "gpu_available": False,
+        "audit_records_dropped": audit_dropped_count(),
     }
 
 
@@ -117,8 +217,13 @@ async def upload_file(
 ):
     """Accept uploads, validate types, and emit audit logs."""
 
-    file_id = f"file_{int(time.time())}"
-    await audit_log(
+    # Random ids never collide under concurrent uploads and never reuse the
+    # client-supplied filename in the storage path.
+    file_id = f"file_{secrets.token_hex(16)}"
+    async with aiofiles.open(os.path.join(UPLOAD_DIR, file_id), "wb") as out:
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            await out.write(chunk)
+    audit_log(
         action="upload_file",
         user_id=user.id,
         resource_type="SourceFile",
@@ -133,8 +238,8 @@ async def upload_file(
     "/claims/kpis",
     response_model=KPIResponse,
     dependencies=[Depends(require_scope(["analytics.read"]))],
+    openapi_extra={PHI_ROUTE_KEY: False},
 )
-@hipaa_compliant(audit_phi=False)
 async def get_kpis(
     user: User = Depends(get_current_user),
     from_: str | None = None,
@@ -144,7 +249,7 @@ async def get_kpis(
 ) -> KPIResponse:
     """Return de-identified KPI aggregates for dashboards."""
 
-    await audit_log(
+    audit_log(
         action="view_kpis",
         user_id=user.id,
         resource_type="Analytics",
@@ -174,8 +279,8 @@ async def get_kpis(
     "/nphies/eligibility",
     response_model=EligibilityResponse,
     dependencies=[Depends(require_scope(["claims.write"]))],
+    openapi_extra={PHI_ROUTE_KEY: True},
 )
-@hipaa_compliant(audit_phi=True)
 async def eligibility_check(
     payload: EligibilityRequest,
     user: User = Depends(get_current_user),
@@ -184,7 +289,7 @@ async def eligibility_check(
 
     national_id = (payload.patient or {}).get("nationalId")
     if not validate_saudi_patient_id(national_id):
-        await audit_log(
+        audit_log(
             action="eligibility_check_failed",
             user_id=user.id,
             resource_type="Eligibility",
@@ -194,7 +299,7 @@ async def eligibility_check(
         )
         return EligibilityResponse(eligible=False, reasons=["Invalid Saudi ID"], coverageSummary=None)
 
-    await audit_log(
+    audit_log(
         action="eligibility_check",
         user_id=user.id,
         resource_type="Eligibility",
@@ -209,19 +314,46 @@ async def eligibility_check(
     )
 
 
+async def _claim_bundle_body(request: Request) -> Dict[str, Any]:
+    """Validate the raw body straight from JSON with the compiled model validator.
+
+    ``model_validate_json`` parses and validates in one pydantic-core pass,
+    skipping the intermediate Python dict FastAPI's body handling builds.
+    """
+
+    try:
+        payload = ClaimBundleRequest.model_validate_json(await request.body())
+    except ValidationError as exc:
+        raise RequestValidationError(
+            [
+                {**error, "loc": ("body", *error["loc"])}
+                for error in exc.errors(include_url=False)
+            ]
+        ) from exc
+    return payload.bundle
+
+
 @app.post(
     "/claims/validate",
     dependencies=[Depends(require_scope(["claims.write"]))],
+    openapi_extra={
+        PHI_ROUTE_KEY: True,
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {"schema": ClaimBundleRequest.model_json_schema()}
+            },
+        },
+    },
 )
-@hipaa_compliant(audit_phi=True)
 async def validate_claim_bundle(
-    payload: ClaimBundleRequest,
+    bundle: Dict[str, Any] = Depends(_claim_bundle_body),
     user: User = Depends(get_current_user),
 ) -> Dict[str, str]:
     """Validate a FHIR Claim bundle and return status or detailed errors."""
 
-    ok, errors = validate_fhir_claim_bundle(payload.bundle)
-    await audit_log(
+    ok, errors = _validate_bundle_cached(bundle)
+    audit_log(
         action="validate_claim_bundle",
         user_id=user.id,
         resource_type="FHIR",
@@ -234,6 +366,54 @@ async def validate_claim_bundle(
     return {"status": "valid"}
 
 
+async def _claim_bundle_batch_body(request: Request) -> List[Dict[str, Any]]:
+    """Parse and validate a JSON array of bundles in one pydantic-core pass."""
+
+    try:
+        return _ClaimBundleBatch.validate_json(await request.body())
+    except ValidationError as exc:
+        raise RequestValidationError(
+            [
+                {**error, "loc": ("body", *error["loc"])}
+                for error in exc.errors(include_url=False)
+            ]
+        ) from exc
+
+
+@app.post(
+    "/claims/validate:batch",
+    response_model=list[BundleValidationResult],
+    dependencies=[Depends(require_scope(["claims.write"]))],
+    openapi_extra={
+        PHI_ROUTE_KEY: True,
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {"schema": _ClaimBundleBatch.json_schema()}
+            },
+        },
+    },
+)
+async def validate_claim_bundles(
+    bundles: List[Dict[str, Any]] = Depends(_claim_bundle_batch_body),
+    user: User = Depends(get_current_user),
+) -> List[BundleValidationResult]:
+    """Validate many FHIR Claim bundles; results are returned in request order."""
+
+    # Validation stops at the first Claim entry, so even very large bundles
+    # validate faster inline than they pickle to a worker process
+    results = validate_fhir_claim_bundles(bundles)
+    audit_log(
+        action="validate_claim_bundles",
+        user_id=user.id,
+        resource_type="FHIR",
+        resource_id="ClaimBundle",
+        phi_involved=True,
+        meta={"count": len(results), "invalid": sum(not ok for ok, _ in results)},
+    )
+    return [BundleValidationResult(valid=ok, errors=errors) for ok, errors in results]
+
+
 @app.post("/process-claim", response_model=ClaimResponse)
 async def process_claim(claim: ClaimRequest) -> ClaimResponse:
     """Mock AI adjudication endpoint retaining audit-friendly outputs."""
@@ -270,4 +450,14 @@ async def detect_fraud(claim: ClaimRequest) -> Dict[str, Any]:
 
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    # WEB_CONCURRENCY sets the worker count (default: one per CPU). Each worker
+    # process keeps its own validation caches and audit writer.
+    workers = int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1))
+    uvicorn.run(
+        "src.main:app",
+        host="0.0.0.0",
+        port=port,
+        loop="uvloop",
+        http="httptools",
+        workers=workers,
+    )
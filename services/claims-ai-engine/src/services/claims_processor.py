@@ -4,20 +4,248 @@ BrainSAIT Digital Insurance Platform
 """
 
 import asyncio
+from contextlib import suppress
+import json
 import logging
-from typing import List, Dict, Any, Optional
-from datetime import datetime, timedelta
-import pandas as pd
+import pickle
+import stat
+import struct
+import zlib
+from typing import Callable, List, Dict, Optional, Tuple
+from datetime import datetime, timezone
+from pathlib import Path
 import numpy as np
+import sklearn
 from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier
-from sklearn.preprocessing import StandardScaler
 import joblib
 import os
+import time
+
+try:  # optional: compiled tree inference (pip install claims-ai-engine[onnx])
+    import onnxruntime as ort
+    from skl2onnx import convert_sklearn
+    from skl2onnx.common.data_types import FloatTensorType
+except ImportError:  # pragma: no cover - sklearn inference is used instead
+    ort = None
 
 from ..models.claim import Claim, ClaimResult, ClaimStatus, ClaimDecision, ClaimMetrics
 
 logger = logging.getLogger(__name__)
 
+# Model input layout; _extract_features emits values in this order
+FEATURE_COLUMNS = (
+    'claim_amount',
+    'patient_age',
+    'provider_experience',
+    'procedure_complexity',
+    'diagnosis_count',
+    'previous_claims',
+    'service_duration',
+    'weekend_service',
+    'emergency_service',
+    'follow_up',
+)
+(
+    COL_CLAIM_AMOUNT,
+    COL_PATIENT_AGE,
+    COL_PROVIDER_EXPERIENCE,
+    COL_PROCEDURE_COMPLEXITY,
+    COL_DIAGNOSIS_COUNT,
+    COL_PREVIOUS_CLAIMS,
+    COL_SERVICE_DURATION,
+    COL_WEEKEND_SERVICE,
+    COL_EMERGENCY_SERVICE,
+    COL_FOLLOW_UP,
+) = range(len(FEATURE_COLUMNS))
+
+SECONDS_PER_DAY = 86_400
+SECONDS_PER_YEAR = 31_557_600.0  # 365.25 days
+
+
+def _utc_ts(value: datetime) -> float:
+    """POSIX timestamp of a datetime; naive values are UTC, as elsewhere here"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def _weekday(ts: float) -> int:
+    """datetime.weekday() of a UTC timestamp (Monday == 0; 1970-01-01 was a Thursday)"""
+    return int((ts // SECONDS_PER_DAY + 3) % 7)
+
+
+# Fallbacks for ids missing from the lookup tables (means of the training data)
+DEFAULT_PROVIDER_EXPERIENCE = 5
+DEFAULT_PREVIOUS_CLAIMS = 3
+
+
+def _load_lookup(env_var: str) -> Dict[str, int]:
+    """Load an id -> count table from the JSON object file named by ``env_var``"""
+    path = os.getenv(env_var)
+    if not path:
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return {str(key): int(value) for key, value in json.load(f).items()}
+
+
+# Trained models are cached here so workers load instead of retraining at startup;
+# the directory must be owned by the service user (the Dockerfile creates it)
+MODEL_PATH = Path(
+    os.getenv("MODEL_PATH", "/var/lib/claims-ai-engine/models.joblib")
+).absolute()
+# Bump when the artifact layout or training data changes to force a retrain
+MODEL_ARTIFACT_VERSION = 2
+# What joblib.load raises on a truncated or corrupt artifact
+_ARTIFACT_LOAD_ERRORS = (
+    OSError,
+    EOFError,
+    pickle.UnpicklingError,
+    struct.error,
+    zlib.error,
+    ValueError,
+    TypeError,
+    KeyError,
+    IndexError,
+    AttributeError,
+    ImportError,
+)
+
+# Set CLAIMS_USE_ONNX=false to force sklearn inference even when onnxruntime
+# is installed
+CLAIMS_USE_ONNX = os.getenv("CLAIMS_USE_ONNX", "true").lower() == "true"
+
+# Micro-batching of model inference across concurrent claims
+PREDICT_MAX_BATCH = int(os.getenv("PREDICT_MAX_BATCH", "64"))
+PREDICT_MAX_WAIT_MS = float(os.getenv("PREDICT_MAX_WAIT_MS", "20"))
+
+
+class FlatForest:
+    """A fitted RandomForestClassifier packed into flat NumPy node arrays.
+    
+    All trees are concatenated (child indices made global) so a batch is
+    scored by walking every (row, tree) pair down one level per step with
+    whole-array operations, instead of sklearn's per-tree Python dispatch.
+    """
+    
+    def __init__(self, forest: RandomForestClassifier, positive_class: int = 1):
+        trees = [estimator.tree_ for estimator in forest.estimators_]
+        offsets = np.cumsum([0] + [tree.node_count for tree in trees[:-1]])
+        class_index = int(np.flatnonzero(forest.classes_ == positive_class)[0])
+        
+        self.roots = offsets.astype(np.int32)
+        self.feature = np.concatenate([tree.feature for tree in trees]).astype(np.int32)
+        self.threshold = np.concatenate(
+            [tree.threshold for tree in trees]
+        ).astype(np.float32)
+        self.is_leaf = np.concatenate([tree.children_left == -1 for tree in trees])
+        self.left = np.concatenate([
+            np.where(tree.children_left == -1, 0, tree.children_left + offset)
+            for tree, offset in zip(trees, offsets)
+        ]).astype(np.int32)
+        self.right = np.concatenate([
+            np.where(tree.children_right == -1, 0, tree.children_right + offset)
+            for tree, offset in zip(trees, offsets)
+        ]).astype(np.int32)
+        # Per-leaf share of the positive class (what predict_proba averages)
+        self.positive_share = np.concatenate([
+            tree.value[:, 0, class_index] / tree.value[:, 0, :].sum(axis=1)
+            for tree in trees
+        ]).astype(np.float32)
+        self.depth = max(tree.max_depth for tree in trees)
+    
+    def predict_positive(self, X: np.ndarray) -> np.ndarray:
+        """Mean positive-class probability per row (predict_proba(X)[:, class])"""
+        X = np.asarray(X, dtype=np.float32)  # sklearn splits on float32 values
+        rows = np.arange(len(X))[:, None]
+        node = np.broadcast_to(self.roots, (len(X), len(self.roots))).copy()
+        for _ in range(self.depth):
+            go_left = X[rows, self.feature[node]] <= self.threshold[node]
+            child = np.where(go_left, self.left[node], self.right[node])
+            node = np.where(self.is_leaf[node], node, child)
+        return self.positive_share[node].mean(axis=1)
+
+
+class PredictionBatcher:
+    """Coalesces concurrent single-claim predictions into one model call.
+    
+    Callers submit a feature vector and await a future; a background consumer
+    takes up to ``max_batch`` queued vectors, stacks them into one matrix and
+    runs ``predict_batch`` once, amortizing sklearn's per-call overhead across
+    the batch. It only lingers (for at most ``max_wait_ms`` after the first
+    vector) while more vectors keep arriving, so a lone claim is scored at
+    once; vectors queued during a model call form the next batch.
+    """
+    
+    def __init__(
+        self,
+        predict_batch: Callable[[np.ndarray], List[Tuple[float, int]]],
+        max_batch: int = PREDICT_MAX_BATCH,
+        max_wait_ms: float = PREDICT_MAX_WAIT_MS
+    ):
+        self.predict_batch = predict_batch
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait_ms / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._closed = False
+    
+    async def predict(self, features: np.ndarray) -> Tuple[float, int]:
+        """Return (approval probability, cost class) for one feature vector"""
+        if self._closed:
+            raise RuntimeError("Prediction batcher closed")
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._collect())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((features, future))
+        return await future
+    
+    async def close(self):
+        """Stop the background consumer and fail predictions still waiting on it"""
+        self._closed = True
+        if self._worker is not None:
+            self._worker.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._worker
+            self._worker = None
+        # Vectors that never reached a batch would otherwise wait forever
+        while self._queue is not None and not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("Prediction batcher closed"))
+    
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            try:
+                deadline = loop.time() + self.max_wait
+                while len(batch) < self.max_batch and loop.time() < deadline:
+                    if self._queue.empty():
+                        # Let callers scheduled in this tick enqueue, then
+                        # dispatch if nobody else is waiting
+                        await asyncio.sleep(0)
+                        if self._queue.empty():
+                            break
+                    batch.append(self._queue.get_nowait())
+            except asyncio.CancelledError:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(RuntimeError("Prediction batcher closed"))
+                raise
+            
+            try:
+                results = self.predict_batch(np.stack([f for f, _ in batch]))
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
 
 class ClaimsProcessor:
     """AI-powered claims processing engine"""
@@ -26,93 +254,208 @@ class ClaimsProcessor:
         self.models_loaded = False
         self.approval_model = None
         self.cost_model = None
-        self.scaler = None
         self.feature_columns = []
         self.tenant_metrics: Dict[str, ClaimMetrics] = {}
-        
-        # Initialize AI models
-        asyncio.create_task(self._load_models())
+        self.approval_session = None
+        self.approval_forest: Optional[FlatForest] = None
+        self.cost_session = None
+        self.predictor = PredictionBatcher(self._predict_batch)
+        # Provider experience (years) and patient prior-claim counts by id
+        self._provider_exp: Dict[str, int] = {}
+        self._patient_prev_claims: Dict[str, int] = {}
     
     async def _load_models(self):
-        """Load pre-trained AI models"""
+        """Load pre-trained AI models.
+        
+        Must be awaited by the owning application at startup (e.g. in the
+        FastAPI lifespan) before the processor receives traffic; failures
+        propagate so the service does not start without models.
+        """
         try:
             logger.info("🧠 Loading AI models for claims processing...")
             
             # In production, load from model registry
-            # For now, create and train basic models
-            await self._create_demo_models()
+            # For now, reuse the cached demo models or train and cache them
+            if not self._load_model_artifact(MODEL_PATH):
+                await self._create_demo_models()
+                self._save_model_artifact(MODEL_PATH)
+            self._prepare_inference()
+            
+            # Feature lookup tables exported from the provider/claims stores
+            self._provider_exp = _load_lookup("PROVIDER_EXPERIENCE_PATH")
+            self._patient_prev_claims = _load_lookup("PATIENT_PREVIOUS_CLAIMS_PATH")
+            logger.info(
+                "📇 Loaded %d provider and %d patient feature entries",
+                len(self._provider_exp),
+                len(self._patient_prev_claims),
+            )
             
             self.models_loaded = True
             logger.info("✅ AI models loaded successfully")
             
         except Exception as e:
-            logger.error(f"❌ Failed to load AI models: {e}")
+            logger.error("❌ Failed to load AI models: %s", e)
+            raise
     
     async def _create_demo_models(self):
         """Create demo AI models for claims processing"""
         # Create sample training data
-        np.random.seed(42)
+        rng = np.random.default_rng(42)  # one PCG64 generator for all synthetic draws
         n_samples = 10000
         
-        # Generate synthetic features
-        features = {
-            'claim_amount': np.random.lognormal(7, 1.5, n_samples),  # Log-normal distribution for amounts
-            'patient_age': np.random.normal(45, 15, n_samples),
-            'provider_experience': np.random.exponential(5, n_samples),
-            'procedure_complexity': np.random.uniform(1, 10, n_samples),
-            'diagnosis_count': np.random.poisson(2, n_samples),
-            'previous_claims': np.random.poisson(3, n_samples),
-            'service_duration': np.random.exponential(2, n_samples),
-            'weekend_service': np.random.binomial(1, 0.15, n_samples),
-            'emergency_service': np.random.binomial(1, 0.1, n_samples),
-            'follow_up': np.random.binomial(1, 0.3, n_samples)
-        }
-        
-        df = pd.DataFrame(features)
-        
-        # Generate approval labels (80% approval rate)
-        approval_probability = (
-            0.8 - 
-            (df['claim_amount'] / df['claim_amount'].max()) * 0.3 +
-            (df['provider_experience'] / df['provider_experience'].max()) * 0.2 -
-            (df['procedure_complexity'] / 10) * 0.1
+        # Generate synthetic features into one contiguous float32 matrix,
+        # one column per FEATURE_COLUMNS entry
+        X = np.empty((n_samples, len(FEATURE_COLUMNS)), dtype=np.float32)
+        # Log-normal distribution for amounts
+        X[:, COL_CLAIM_AMOUNT] = rng.lognormal(7, 1.5, n_samples)
+        X[:, COL_PATIENT_AGE] = rng.normal(45, 15, n_samples)
+        X[:, COL_PROVIDER_EXPERIENCE] = rng.exponential(5, n_samples)
+        X[:, COL_PROCEDURE_COMPLEXITY] = rng.uniform(1, 10, n_samples)
+        X[:, COL_DIAGNOSIS_COUNT] = rng.poisson(2, n_samples)
+        X[:, COL_PREVIOUS_CLAIMS] = rng.poisson(3, n_samples)
+        X[:, COL_SERVICE_DURATION] = rng.exponential(2, n_samples)
+        X[:, COL_WEEKEND_SERVICE] = rng.binomial(1, 0.15, n_samples)
+        X[:, COL_EMERGENCY_SERVICE] = rng.binomial(1, 0.1, n_samples)
+        X[:, COL_FOLLOW_UP] = rng.binomial(1, 0.3, n_samples)
+        
+        claim_amount = X[:, COL_CLAIM_AMOUNT]
+        amount_max = claim_amount.max()
+        experience_max = X[:, COL_PROVIDER_EXPERIENCE].max()
+        
+        # Generate approval labels (80% approval rate); clipped so the
+        # probability stays valid whatever the synthetic distributions produce
+        approval_probability = np.clip(
+            0.8
+            - (claim_amount / amount_max) * 0.3
+            + (X[:, COL_PROVIDER_EXPERIENCE] / experience_max) * 0.2
+            - (X[:, COL_PROCEDURE_COMPLEXITY] / 10) * 0.1,
+            0.0,
+            1.0,
         )
-        approval_labels = np.random.binomial(1, approval_probability, n_samples)
+        approval_labels = (
+            rng.random(n_samples, dtype=np.float32) < approval_probability
+        ).astype(np.int8)
         
         # Train approval model
         self.approval_model = RandomForestClassifier(
             n_estimators=100,
             max_depth=10,
-            random_state=42
+            random_state=42,
+            n_jobs=-1
         )
-        self.approval_model.fit(df, approval_labels)
+        self.approval_model.fit(X, approval_labels)
         
         # Train cost estimation model
         # Actual costs are claim amounts with some variance for approved claims
         actual_costs = np.where(
             approval_labels,
-            df['claim_amount'] * np.random.normal(0.95, 0.1, n_samples),
+            claim_amount * rng.normal(0.95, 0.1, n_samples),
             0
         )
         
         self.cost_model = GradientBoostingClassifier(random_state=42)
-        cost_features = df.copy()
-        cost_features['original_amount'] = df['claim_amount']
         
-        # Use quantiles for cost prediction classes
-        cost_classes = pd.qcut(actual_costs[actual_costs > 0], 5, labels=False)
+        # Use quantiles for cost prediction classes (quintiles, right-inclusive bins)
+        approved_costs = actual_costs[actual_costs > 0]
+        quintile_edges = np.quantile(approved_costs, [0.2, 0.4, 0.6, 0.8])
+        cost_classes = np.searchsorted(quintile_edges, approved_costs, side="left")
         cost_labels = np.full(n_samples, -1)  # -1 for denied claims
         cost_labels[approval_labels == 1] = cost_classes
         
-        self.cost_model.fit(cost_features, cost_labels)
-        
-        # Fit scaler
-        self.scaler = StandardScaler()
-        self.scaler.fit(df)
-        self.feature_columns = df.columns.tolist()
+        # Same raw feature matrix as the approval model; trees split on
+        # thresholds, so no feature scaling is needed at train or serve time
+        self.cost_model.fit(X, cost_labels)
         
         logger.info("🎯 Demo AI models created and trained")
     
+    def _load_model_artifact(self, path: Path) -> bool:
+        """Load models from a joblib artifact; False if missing, unusable or stale"""
+        if not path.exists():
+            return False
+        try:
+            if path.stat().st_mode & stat.S_IWOTH:
+                # Anyone could have replaced it, and loading unpickles it
+                logger.warning(
+                    "⚠️ Ignoring world-writable model artifact %s; retraining", path
+                )
+                return False
+            # Compressed artifacts are decompressed into memory (mmap_mode is ignored)
+            artifact = joblib.load(path)
+            if (
+                artifact.get("version") != MODEL_ARTIFACT_VERSION
+                or artifact.get("sklearn_version") != sklearn.__version__
+                or tuple(artifact.get("feature_columns", ())) != FEATURE_COLUMNS
+            ):
+                logger.warning("⚠️ Ignoring stale model artifact %s; retraining", path)
+                return False
+            approval_model = artifact["approval_model"]
+            cost_model = artifact["cost_model"]
+        except _ARTIFACT_LOAD_ERRORS as e:
+            logger.warning("⚠️ Unreadable model artifact %s (%s); retraining", path, e)
+            return False
+        self.approval_model = approval_model
+        self.cost_model = cost_model
+        logger.info("📦 Loaded models from %s", path)
+        return True
+    
+    def _save_model_artifact(self, path: Path):
+        """Cache the trained models for later startups.
+        
+        Failures are logged, not raised: the models trained in memory still
+        serve, and the next startup retrains.
+        """
+        artifact = {
+            "version": MODEL_ARTIFACT_VERSION,
+            "sklearn_version": sklearn.__version__,
+            "feature_columns": FEATURE_COLUMNS,
+            "approval_model": self.approval_model,
+            "cost_model": self.cost_model,
+        }
+        # Write then rename so concurrently starting workers never read a partial file
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            joblib.dump(artifact, tmp_path, compress=3)
+            os.replace(tmp_path, path)
+        except (OSError, pickle.PicklingError) as e:
+            logger.warning(
+                "⚠️ Could not save models to %s (%s); using the in-memory models",
+                path,
+                e,
+            )
+            with suppress(OSError):
+                tmp_path.unlink(missing_ok=True)
+            return
+        logger.info("💾 Saved models to %s", path)
+    
+    def _prepare_inference(self):
+        """Derive the inference-time state from the fitted models"""
+        # Serve single-threaded: per-request parallelism only adds dispatch overhead
+        self.approval_model.set_params(n_jobs=1)
+        self.approval_forest = FlatForest(self.approval_model)
+        self.feature_columns = list(FEATURE_COLUMNS)  # for logging/inspection only
+        
+        if ort is not None and CLAIMS_USE_ONNX:
+            self.approval_session = self._compile_onnx(self.approval_model)
+            self.cost_session = self._compile_onnx(self.cost_model)
+            logger.info("⚡ Models compiled to ONNX Runtime")
+    
+    def _compile_onnx(self, model) -> "ort.InferenceSession":
+        """Convert a fitted sklearn classifier into an ONNX Runtime session"""
+        onnx_model = convert_sklearn(
+            model,
+            initial_types=[("X", FloatTensorType([None, model.n_features_in_]))],
+            options={id(model): {"zipmap": False}},  # plain probability matrix
+        )
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = 1  # concurrency comes from request batching
+        return ort.InferenceSession(
+            onnx_model.SerializeToString(),
+            sess_options=options,
+            providers=["CPUExecutionProvider"],
+        )
+    
     def is_ready(self) -> bool:
         """Check if AI models are loaded and ready"""
         return self.models_loaded
@@ -128,18 +471,14 @@ class ClaimsProcessor:
         if not self.models_loaded:
             raise RuntimeError("AI models not loaded")
         
-        start_time = datetime.utcnow()
+        start_ns = time.perf_counter_ns()
         
         try:
             # Extract features from claim
             features = self._extract_features(claim)
             
-            # Scale features
-            scaled_features = self.scaler.transform([features])
-            
-            # Get AI predictions
-            approval_prob = self.approval_model.predict_proba(scaled_features)[0][1]
-            cost_prediction = self.cost_model.predict(scaled_features)[0]
+            # Get AI predictions (batched with concurrent claims)
+            approval_prob, cost_prediction = await self.predictor.predict(features)
             
             # Make decision based on confidence thresholds
             if approval_prob >= 0.85:
@@ -181,51 +520,72 @@ class ClaimsProcessor:
                 compliance_flags=compliance_flags,
                 processing_notes=[
                     f"AI processed with {approval_prob:.2%} approval confidence",
-                    f"Processing time: {(datetime.utcnow() - start_time).total_seconds():.2f}s"
+                    f"Processing time: {(time.perf_counter_ns() - start_ns) / 1e9:.2f}s"
                 ]
             )
             
             # Update metrics
-            await self._update_metrics(tenant_id, claim, result, start_time)
+            await self._update_metrics(tenant_id, claim, result, start_ns)
             
             return result
             
         except Exception as e:
-            logger.error(f"❌ Error processing claim {claim.id}: {e}")
+            logger.error("❌ Error processing claim %s: %s", claim.id, e)
             raise
     
-    def _extract_features(self, claim: Claim) -> List[float]:
-        """Extract numerical features from claim for AI processing"""
-        
-        # Calculate patient age
-        patient_age = (datetime.utcnow() - claim.patient.date_of_birth).days / 365.25
-        
-        # Calculate service duration
-        service_start = claim.service_period.get('start', datetime.utcnow())
-        service_end = claim.service_period.get('end', datetime.utcnow())
-        service_duration = (service_end - service_start).days + 1
-        
-        # Check if weekend service
-        weekend_service = 1 if service_start.weekday() >= 5 else 0
-        
-        # Mock provider experience (in production, from provider database)
-        provider_experience = hash(claim.provider.id) % 20 + 1
-        
-        # Count procedure complexity (based on number of procedures and diagnosis)
-        procedure_complexity = len(claim.items) + len(claim.secondary_diagnoses)
-        
-        features = [
-            float(claim.total_amount),
-            float(patient_age),
-            float(provider_experience),
-            float(procedure_complexity),
-            float(len(claim.secondary_diagnoses) + 1),  # diagnosis count
-            float(hash(claim.patient.id) % 10),  # mock previous claims
-            float(service_duration),
-            float(weekend_service),
-            float(0),  # emergency service (mock)
-            float(0)   # follow up (mock)
-        ]
+    def _predict_batch(self, features: np.ndarray) -> List[Tuple[float, int]]:
+        """Score a raw (n_claims, n_features) matrix in one pass"""
+        if self.approval_session is not None:
+            inputs = {"X": features}
+            approval_probs = self.approval_session.run(None, inputs)[1][:, 1]
+            cost_predictions = self.cost_session.run(None, inputs)[0]
+        else:
+            approval_probs = self.approval_forest.predict_positive(features)
+            cost_predictions = self.cost_model.predict(features)
+        return list(zip(approval_probs.tolist(), cost_predictions.tolist()))
+    
+    def _extract_features(
+        self, claim: Claim, out: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """Extract numerical features from claim for AI processing.
+        
+        Values are written straight into a float32 row laid out as
+        FEATURE_COLUMNS (``out`` if given). The row is queued for batched
+        inference while the caller awaits, so callers must pass a row they
+        own rather than a shared scratch buffer.
+        """
+        
+        features = (
+            np.empty(len(FEATURE_COLUMNS), dtype=np.float32) if out is None else out
+        )
+        now_ts = time.time()
+        
+        # Calculate service period once (timestamps; missing bounds mean "now")
+        service_start = claim.service_period.get('start')
+        service_end = claim.service_period.get('end')
+        start_ts = now_ts if service_start is None else _utc_ts(service_start)
+        end_ts = now_ts if service_end is None else _utc_ts(service_end)
+        
+        secondary_count = len(claim.secondary_diagnoses)
+        
+        features[COL_CLAIM_AMOUNT] = claim.total_amount
+        features[COL_PATIENT_AGE] = (
+            now_ts - _utc_ts(claim.patient.date_of_birth)
+        ) / SECONDS_PER_YEAR
+        features[COL_PROVIDER_EXPERIENCE] = self._provider_exp.get(
+            claim.provider.id, DEFAULT_PROVIDER_EXPERIENCE
+        )
+        # Procedure complexity: number of procedures and secondary diagnoses
+        features[COL_PROCEDURE_COMPLEXITY] = len(claim.items) + secondary_count
+        features[COL_DIAGNOSIS_COUNT] = secondary_count + 1
+        features[COL_PREVIOUS_CLAIMS] = self._patient_prev_claims.get(
+            claim.patient.id, DEFAULT_PREVIOUS_CLAIMS
+        )
+        # Service duration in whole days, inclusive
+        features[COL_SERVICE_DURATION] = (end_ts - start_ts) // SECONDS_PER_DAY + 1
+        features[COL_WEEKEND_SERVICE] = _weekday(start_ts) >= 5
+        features[COL_EMERGENCY_SERVICE] = 0  # mock
+        features[COL_FOLLOW_UP] = 0  # mock
         
         return features
     
@@ -279,7 +639,9 @@ class ClaimsProcessor:
             flags.append("High amount with few procedures - review needed")
         
         # Date validations
-        submission_delay = (datetime.utcnow() - claim.service_period['start']).days
+        submission_delay = (
+            time.time() - _utc_ts(claim.service_period['start'])
+        ) // SECONDS_PER_DAY
         if submission_delay > 90:
             flags.append("Claim submitted more than 90 days after service")
         
@@ -290,76 +652,67 @@ class ClaimsProcessor:
         tenant_id: str, 
         claim: Claim, 
         result: ClaimResult, 
-        start_time: datetime
+        start_ns: int
     ):
         """Update tenant processing metrics"""
         
-        processing_time = (datetime.utcnow() - start_time).total_seconds() * 1000
+        processing_time = (time.perf_counter_ns() - start_ns) / 1e6  # ms
         
-        if tenant_id not in self.tenant_metrics:
-            self.tenant_metrics[tenant_id] = ClaimMetrics(
-                tenant_id=tenant_id,
-                claims_today=0,
-                claims_this_month=0,
-                avg_processing_time=0,
-                auto_approval_rate=0,
+        metrics = self.tenant_metrics.get(tenant_id)
+        if metrics is None:
+            metrics = self.tenant_metrics[tenant_id] = self._new_metrics(
+                tenant_id,
                 accuracy_score=0.95,  # Default high accuracy
-                cost_savings=0,
-                fraud_detected=0,
                 compliance_violations=len(result.compliance_flags)
             )
         
-        metrics = self.tenant_metrics[tenant_id]
         metrics.claims_today += 1
         metrics.claims_this_month += 1
+        n = metrics.claims_today
         
-        # Update average processing time
-        metrics.avg_processing_time = (
-            (metrics.avg_processing_time * (metrics.claims_today - 1) + processing_time) 
-            / metrics.claims_today
-        )
-        
-        # Update auto approval rate
-        if result.decision == ClaimDecision.AUTO_APPROVE:
-            metrics.auto_approval_rate = (
-                (metrics.auto_approval_rate * (metrics.claims_today - 1) + 100) 
-                / metrics.claims_today
-            )
-        else:
-            metrics.auto_approval_rate = (
-                (metrics.auto_approval_rate * (metrics.claims_today - 1)) 
-                / metrics.claims_today
-            )
+        # Running means (Welford): mean += (x - mean) / n
+        metrics.avg_processing_time += (
+            processing_time - metrics.avg_processing_time
+        ) / n
+        auto_approved = 100.0 if result.decision == ClaimDecision.AUTO_APPROVE else 0.0
+        metrics.auto_approval_rate += (auto_approved - metrics.auto_approval_rate) / n
         
         # Estimate cost savings (manual review cost vs auto processing)
-        if result.decision in [ClaimDecision.AUTO_APPROVE, ClaimDecision.AUTO_DENY]:
+        if result.decision in (ClaimDecision.AUTO_APPROVE, ClaimDecision.AUTO_DENY):
             metrics.cost_savings += 50  # SAR saved per auto-processed claim
     
     async def get_metrics(self, tenant_id: str) -> ClaimMetrics:
         """Get processing metrics for a tenant"""
-        return self.tenant_metrics.get(
-            tenant_id, 
-            ClaimMetrics(
-                tenant_id=tenant_id,
-                claims_today=0,
-                claims_this_month=0,
-                avg_processing_time=0,
-                auto_approval_rate=0,
-                accuracy_score=0,
-                cost_savings=0,
-                fraud_detected=0,
-                compliance_violations=0
-            )
+        metrics = self.tenant_metrics.get(tenant_id)
+        return metrics if metrics is not None else self._new_metrics(tenant_id)
+    
+    @staticmethod
+    def _new_metrics(
+        tenant_id: str,
+        accuracy_score: float = 0,
+        compliance_violations: int = 0
+    ) -> ClaimMetrics:
+        """Zeroed metrics for a tenant that has not processed a claim yet"""
+        return ClaimMetrics(
+            tenant_id=tenant_id,
+            claims_today=0,
+            claims_this_month=0,
+            avg_processing_time=0,
+            auto_approval_rate=0,
+            accuracy_score=accuracy_score,
+            cost_savings=0,
+            fraud_detected=0,
+            compliance_violations=compliance_violations
         )
     
     async def retrain_models(self, tenant_id: str):
         """Retrain AI models with tenant-specific data"""
-        logger.info(f"🔄 Starting model retraining for tenant {tenant_id}")
+        logger.info("🔄 Starting model retraining for tenant %s", tenant_id)
         
         # Simulate retraining process
         await asyncio.sleep(2)  # Simulate training time
         
-        logger.info(f"✅ Model retraining completed for tenant {tenant_id}")
+        logger.info("✅ Model retraining completed for tenant %s", tenant_id)
         
         # In production, this would:
         # 1. Fetch tenant's historical claim data
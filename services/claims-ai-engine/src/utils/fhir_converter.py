@@ -3,9 +3,19 @@ FHIR R4 converter and validation utilities
 BrainSAIT Digital Insurance Platform
 """
 
-from typing import Dict, Any, List, Optional
-import json
+from typing import (
+    Awaitable, Callable, Dict, Any, List, Mapping, NamedTuple, Optional, Tuple, Type,
+    Union,
+)
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from types import MappingProxyType
 from datetime import datetime
+from functools import lru_cache
+import asyncio
+import keyword
+import time
+import orjson
 from pydantic import ValidationError
 import logging
 
@@ -13,6 +23,318 @@ from ..models.claim import Claim, Patient, Provider, ClaimItem, DiagnosisCode, P
 
 logger = logging.getLogger(__name__)
 
+# Input formats recognised by FHIRConverter._detect_format
+FORMAT_FHIR = "fhir"
+FORMAT_HL7V2 = "hl7v2"
+FORMAT_SBS = "sbs"
+FORMAT_CUSTOM = "custom"
+
+# Identifier families read by the FHIR converter: the national ID matches its
+# system URL exactly, the others by substring of the lower-cased system
+NATIONAL_ID_SYSTEM = "http://nphies.sa/identifier/national-id"
+_IDENTIFIER_FAMILIES = (("ins", "insurance"), ("lic", "license"), ("nph", "nphies"))
+
+# HumanName extension URLs that carry a patient's Arabic name
+ARABIC_EXT_URLS = frozenset({
+    "http://nphies.sa/fhir/StructureDefinition/arabic-name",
+})
+
+# Formats whose converters skip model validation (see strict_validate)
+_CONSTRUCTED_FORMATS = frozenset({FORMAT_SBS, FORMAT_CUSTOM})
+
+
+# Shared read-only defaults for .get() chains over optional FHIR/HL7/SBS
+# elements, so a missing element does not allocate a fresh {} or [{}]
+_EMPTY: Mapping[str, Any] = MappingProxyType({})
+_EMPTY_LIST = (_EMPTY,)
+
+# Fallback for missing birth dates (and, in HL7 v2 only, unparseable ones;
+# unparseable ISO dates raise)
+_DEFAULT_DOB = datetime(1970, 1, 1)
+
+# Placeholder diagnoses for claims or items without one; shared across claims,
+# so they must not be mutated
+_PLACEHOLDER_DX = DiagnosisCode.model_construct(
+    code="Z00.00", system="ICD-10", display="General examination"
+)
+_HL7_PLACEHOLDER_DX = DiagnosisCode.model_construct(
+    code="Z00.00", system="ICD-10", display="Encounter for general examination"
+)
+
+
+@lru_cache(maxsize=512)
+def _parse_iso(value: str) -> datetime:
+    """datetime.fromisoformat, memoized since a claim's items usually share dates"""
+    return datetime.fromisoformat(value)
+
+
+@lru_cache(maxsize=256)
+def _identifier_families(system: str) -> Tuple[str, ...]:
+    """Identifier families an identifier system URL belongs to
+    
+    Memoized: claims reuse a handful of system URLs, so each is lower-cased
+    and substring-matched once rather than per identifier.
+    """
+    families = ("nid",) if system == NATIONAL_ID_SYSTEM else ()
+    system_lower = system.lower()
+    return families + tuple(
+        family for family, needle in _IDENTIFIER_FAMILIES if needle in system_lower
+    )
+
+
+def _parse_iso_or(value: Optional[str], default: datetime) -> datetime:
+    """Parse an ISO date, returning the shared ``default`` object when it is missing"""
+    return _parse_iso(value) if value else default
+
+
+def _parse_dob(value: Optional[str]) -> datetime:
+    return _parse_iso_or(value, _DEFAULT_DOB)
+
+
+class FieldSpec(NamedTuple):
+    """One model field read from a source document: ``path`` is the key path
+    (empty for a constant), ``default`` applies when the last key is missing,
+    ``convert`` (if set) is applied to the value."""
+    name: str
+    path: Tuple[str, ...]
+    default: Any = ""
+    convert: Optional[Callable[[Any], Any]] = None
+
+
+@dataclass(frozen=True)
+class SchemaSpec:
+    """Mapping of a fixed source schema (e.g. SBS, a tenant's custom format) to a model
+    
+    ``params`` names model fields the caller computes and passes as keyword
+    arguments to the compiled extractor (nested models, dates relative to now).
+    """
+    model: Type[Any]
+    fields: Tuple[FieldSpec, ...]
+    params: Tuple[str, ...] = ()
+
+
+_LITERAL_TYPES = (str, int, float, bool, type(None))
+
+
+@lru_cache(maxsize=64)
+def compile_extractor(spec: SchemaSpec) -> Callable[..., Any]:
+    """
+    Generate a specialized ``extract(d, *, <params>)`` function for a SchemaSpec
+    
+    The generated code reads every field with straight-line ``.get`` calls,
+    binding each shared parent dict (e.g. ``d["patient_info"]``) to a local
+    once, and passes the values and params to ``spec.model.model_construct``.
+    Compiled once per spec.
+    """
+    namespace: Dict[str, Any] = {
+        "_EMPTY": _EMPTY, "_construct": spec.model.model_construct
+    }
+    parents: Dict[Tuple[str, ...], str] = {(): "d"}
+    body = []
+    arguments = []
+    for name in (*(field_spec.name for field_spec in spec.fields), *spec.params):
+        if not name.isidentifier() or keyword.iskeyword(name) or name == "d":
+            raise ValueError(f"Invalid field name: {name!r}")
+    
+    for index, field_spec in enumerate(spec.fields):
+        if not all(isinstance(key, str) for key in field_spec.path):
+            raise ValueError(f"Invalid path for {field_spec.name}: {field_spec.path!r}")
+        
+        for depth in range(1, len(field_spec.path)):
+            prefix = field_spec.path[:depth]
+            if prefix not in parents:
+                parents[prefix] = f"_p{len(parents)}"
+                parent = parents[prefix[:-1]]
+                body.append(
+                    f"    {parents[prefix]} = {parent}.get({prefix[-1]!r}, _EMPTY)"
+                )
+        
+        if isinstance(field_spec.default, _LITERAL_TYPES):
+            default = repr(field_spec.default)
+        else:
+            default = f"_d{index}"
+            namespace[default] = field_spec.default
+        if field_spec.path:
+            parent = parents[field_spec.path[:-1]]
+            value = f"{parent}.get({field_spec.path[-1]!r}, {default})"
+        else:
+            value = default
+        if field_spec.convert is not None:
+            namespace[f"_c{index}"] = field_spec.convert
+            value = f"_c{index}({value})"
+        arguments.append(f"        {field_spec.name}={value},")
+    
+    arguments.extend(f"        {name}={name}," for name in spec.params)
+    signature = ", ".join(["d", *(["*", *spec.params] if spec.params else [])])
+    source = "\n".join([
+        f"def extract({signature}):",
+        *body,
+        "    return _construct(",
+        *arguments,
+        "    )",
+    ])
+    exec(compile(source, f"<extractor {spec.model.__name__}>", "exec"), namespace)
+    return namespace["extract"]
+
+
+# Saudi Billing Standard and custom-format field mappings (see compile_extractor)
+_CLAIM_PARAMS = (
+    "patient",
+    "provider",
+    "items",
+    "primary_diagnosis",
+    "secondary_diagnoses",
+    "service_period",
+)
+SBS_PATIENT_SPEC = SchemaSpec(Patient, (
+    FieldSpec("id", ("patient_info", "patient_id")),
+    FieldSpec("national_id", ("patient_info", "national_id")),
+    FieldSpec("name", ("patient_info", "name_en")),
+    FieldSpec("arabic_name", ("patient_info", "name_ar")),
+    FieldSpec("date_of_birth", ("patient_info", "date_of_birth"), None, _parse_dob),
+    FieldSpec("gender", ("patient_info", "gender"), "unknown"),
+    FieldSpec("insurance_id", ("patient_info", "insurance_number")),
+))
+SBS_PROVIDER_SPEC = SchemaSpec(Provider, (
+    FieldSpec("id", ("provider_info", "provider_id")),
+    FieldSpec("name", ("provider_info", "name_en")),
+    FieldSpec("arabic_name", ("provider_info", "name_ar")),
+    FieldSpec("license_number", ("provider_info", "license_number")),
+    FieldSpec("specialty", ("provider_info", "specialty")),
+    FieldSpec("nphies_provider_id", ("provider_info", "nphies_id")),
+))
+SBS_PROCEDURE_SPEC = SchemaSpec(ProcedureCode, (
+    FieldSpec("code", ("procedure_code",)),
+    FieldSpec("display", ("procedure_description",)),
+    FieldSpec("arabic_display", ("procedure_description_ar",)),
+    FieldSpec("system", (), "SBS"),
+    FieldSpec("cost", ("unit_price",), 0, float),
+))
+SBS_ITEM_SPEC = SchemaSpec(ClaimItem, (
+    FieldSpec("sequence", ("line_number",), 1, int),
+    FieldSpec("quantity", ("quantity",), 1, int),
+    FieldSpec("unit_price", ("unit_price",), 0, float),
+    FieldSpec("total_amount", ("total_amount",), 0, float),
+), params=("procedure_code", "diagnosis_codes", "service_date"))
+SBS_DIAGNOSIS_SPEC = SchemaSpec(DiagnosisCode, (
+    FieldSpec("code", ("primary_diagnosis", "code")),
+    FieldSpec("system", (), "ICD-10"),
+    FieldSpec("display", ("primary_diagnosis", "description")),
+    FieldSpec("arabic_display", ("primary_diagnosis", "description_ar")),
+))
+SBS_CLAIM_SPEC = SchemaSpec(Claim, (
+    FieldSpec("id", ("claim_id",)),
+    FieldSpec("tenant_id", (), "default"),
+    FieldSpec("claim_number", ("claim_number",)),
+    FieldSpec("total_amount", ("total_amount",), 0, float),
+    FieldSpec("insurance_plan", ("insurance_plan",)),
+    FieldSpec("policy_number", ("policy_number",)),
+), params=_CLAIM_PARAMS)
+CUSTOM_PATIENT_SPEC = SchemaSpec(Patient, (
+    FieldSpec("id", ("patient", "id")),
+    FieldSpec("national_id", ("patient", "national_id")),
+    FieldSpec("name", ("patient", "name")),
+    FieldSpec("date_of_birth", ("patient", "date_of_birth"), None, _parse_dob),
+    FieldSpec("gender", ("patient", "gender"), "unknown"),
+    FieldSpec("insurance_id", ("patient", "insurance_id")),
+))
+CUSTOM_PROVIDER_SPEC = SchemaSpec(Provider, (
+    FieldSpec("id", ("provider", "id")),
+    FieldSpec("name", ("provider", "name")),
+    FieldSpec("license_number", ("provider", "license")),
+    FieldSpec("specialty", ("provider", "specialty")),
+    FieldSpec("nphies_provider_id", ("provider", "nphies_id")),
+))
+CUSTOM_CLAIM_SPEC = SchemaSpec(Claim, (
+    FieldSpec("id", ("id",)),
+    FieldSpec("tenant_id", ("tenant_id",), "default"),
+    FieldSpec("claim_number", ("claim_number",)),
+    FieldSpec("total_amount", ("total_amount",), 0, float),
+    FieldSpec("insurance_plan", ("insurance_plan",)),
+    FieldSpec("policy_number", ("policy_number",)),
+), params=_CLAIM_PARAMS)
+
+
+@dataclass
+class _DiagnosisScan:
+    """FHIR claim diagnoses gathered in one pass (see FHIRConverter._scan_diagnoses)"""
+    primary: Optional[DiagnosisCode] = None
+    secondary: List[DiagnosisCode] = field(default_factory=list)
+    by_sequence: Dict[int, DiagnosisCode] = field(default_factory=dict)
+
+
+class FhirRefLoader:
+    """
+    Coalescing, TTL-cached resolver for FHIR references
+    
+    load_many() fetches each distinct uncached reference once, concurrently;
+    callers asking for a reference that is already being fetched share that
+    fetch. Resolved resources are cached for ``ttl`` seconds (LRU-bounded by
+    ``maxsize``) and must be treated as read-only by callers.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[str], Awaitable[Dict[str, Any]]],
+        maxsize: int = 10000,
+        ttl: float = 60.0,
+    ):
+        self._fetch = fetch
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._cache: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._inflight: Dict[str, "asyncio.Future[Dict[str, Any]]"] = {}
+
+    def get_cached(self, reference: str) -> Optional[Dict[str, Any]]:
+        """Return the cached resource for a reference, or None if absent or expired"""
+        entry = self._cache.get(reference)
+        if entry is None or entry[0] <= time.monotonic():
+            return None
+        self._cache.move_to_end(reference)
+        return entry[1]
+
+    async def load(self, reference: str) -> Dict[str, Any]:
+        """Resolve one reference"""
+        return (await self.load_many([reference]))[reference]
+
+    async def load_many(self, references: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Resolve references to resources; cache hits return without awaiting"""
+        now = time.monotonic()
+        resolved: Dict[str, Dict[str, Any]] = {}
+        pending: Dict[str, "asyncio.Future[Dict[str, Any]]"] = {}
+        for reference in references:
+            if reference in resolved or reference in pending:
+                continue
+            entry = self._cache.get(reference)
+            if entry is not None and entry[0] > now:
+                self._cache.move_to_end(reference)
+                resolved[reference] = entry[1]
+                continue
+            future = self._inflight.get(reference)
+            if future is None:
+                future = asyncio.ensure_future(self._load(reference))
+                self._inflight[reference] = future
+            pending[reference] = future
+        
+        if pending:
+            # shield: a cancelled caller must not cancel fetches other callers share
+            values = await asyncio.gather(
+                *(asyncio.shield(future) for future in pending.values())
+            )
+            resolved.update(zip(pending, values))
+        return resolved
+
+    async def _load(self, reference: str) -> Dict[str, Any]:
+        try:
+            resource = await self._fetch(reference)
+        finally:
+            del self._inflight[reference]
+        self._cache[reference] = (time.monotonic() + self.ttl, resource)
+        self._cache.move_to_end(reference)
+        if len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+        return resource
+
 
 class FHIRConverter:
     """
@@ -20,129 +342,223 @@ class FHIRConverter:
     Handles conversion between various formats and FHIR resources
     """
 
-    def __init__(self):
+    def __init__(self, strict_validate: bool = False):
         self.fhir_version = "4.0.1"
+        # Re-validate claims from converters that use model_construct
+        self.strict_validate = strict_validate
         self.supported_resources = [
             "Patient", "Practitioner", "Organization", "Claim", 
             "Coverage", "CoverageEligibilityRequest", "CoverageEligibilityResponse"
         ]
+        # Converters are synchronous; FHIR references are resolved beforehand
+        # (see validate_claim), so the FHIR converter is called separately
+        self._converters = {
+            FORMAT_HL7V2: self._convert_hl7v2_to_claim,
+            FORMAT_SBS: self._convert_sbs_to_claim,
+            FORMAT_CUSTOM: self._convert_custom_to_claim,
+        }
+        # Field extractors for the fixed SBS and custom schemas
+        self._sbs_patient = compile_extractor(SBS_PATIENT_SPEC)
+        self._sbs_provider = compile_extractor(SBS_PROVIDER_SPEC)
+        self._sbs_procedure = compile_extractor(SBS_PROCEDURE_SPEC)
+        self._sbs_item = compile_extractor(SBS_ITEM_SPEC)
+        self._sbs_diagnosis = compile_extractor(SBS_DIAGNOSIS_SPEC)
+        self._sbs_claim = compile_extractor(SBS_CLAIM_SPEC)
+        self._custom_patient = compile_extractor(CUSTOM_PATIENT_SPEC)
+        self._custom_provider = compile_extractor(CUSTOM_PROVIDER_SPEC)
+        self._custom_claim = compile_extractor(CUSTOM_CLAIM_SPEC)
+        # Patient and provider references resolve through separate stubs, so
+        # each gets its own loader (an empty reference means different things)
+        self._patient_loader = FhirRefLoader(self._resolve_patient_reference)
+        self._provider_loader = FhirRefLoader(self._resolve_provider_reference)
+
+    @staticmethod
+    def _decode_claim_json(raw: Union[bytes, bytearray, memoryview]) -> Dict[str, Any]:
+        """Parse a JSON claim body once with orjson; it must be a JSON object"""
+        try:
+            claim_data = orjson.loads(raw)
+        except orjson.JSONDecodeError as e:
+            logger.error("Claim JSON decoding failed: %s", e)
+            raise ValueError(f"Invalid claim data: {e}")
+        if not isinstance(claim_data, dict):
+            raise ValueError("Invalid claim data: expected a JSON object")
+        return claim_data
 
-    async def validate_claim(self, claim_data: Dict[str, Any]) -> Claim:
+    async def validate_claim(
+        self, claim_data: Union[Dict[str, Any], bytes, bytearray, memoryview]
+    ) -> Claim:
         """
         Validate incoming claim data and convert to FHIR-compliant format
+        
+        Accepts a parsed dict or the raw JSON body (bytes/memoryview), which
+        is decoded here so HTTP callers can pass ``await request.body()``
+        straight through; callers holding a dict should not re-serialize it.
         """
+        if isinstance(claim_data, (bytes, bytearray, memoryview)):
+            claim_data = self._decode_claim_json(claim_data)
         try:
-            # Check if already in FHIR format
-            if self._is_fhir_format(claim_data):
-                return await self._convert_fhir_to_claim(claim_data)
-            
-            # Check if HL7 v2 format
-            elif self._is_hl7v2_format(claim_data):
-                return await self._convert_hl7v2_to_claim(claim_data)
-            
-            # Check if SBS (Saudi Billing Standard) format
-            elif self._is_sbs_format(claim_data):
-                return await self._convert_sbs_to_claim(claim_data)
-            
-            # Assume custom format and try direct conversion
+            claim_format = self._detect_format(claim_data)
+            # One timestamp per claim for every missing service date
+            now = datetime.now()
+            if claim_format == FORMAT_FHIR:
+                patient_data, provider_data = await self._resolve_references(claim_data)
+                claim = self._convert_fhir_to_claim(
+                    claim_data, now, patient_data, provider_data
+                )
             else:
-                return await self._convert_custom_to_claim(claim_data)
+                claim = self._converters[claim_format](claim_data, now)
+            if self.strict_validate and claim_format in _CONSTRUCTED_FORMATS:
+                claim = Claim.model_validate(claim.model_dump())
+            return claim
                 
         except ValidationError as e:
-            logger.error(f"Claim validation failed: {e}")
+            logger.error("Claim validation failed: %s", e)
             raise ValueError(f"Invalid claim data: {e}")
         except Exception as e:
-            logger.error(f"Claim conversion failed: {e}")
+            logger.error("Claim conversion failed: %s", e)
             raise ValueError(f"Claim conversion error: {e}")
 
-    def _is_fhir_format(self, data: Dict[str, Any]) -> bool:
-        """Check if data is in FHIR R4 format"""
-        return (
-            isinstance(data, dict) and 
-            data.get("resourceType") == "Claim" and
-            data.get("meta", {}).get("versionId") is not None
-        )
+    async def validate_claims(
+        self,
+        batch: List[Union[Dict[str, Any], bytes, bytearray, memoryview]],
+        concurrency: int = 32,
+    ) -> List[Claim]:
+        """
+        Validate many claims concurrently, returning them in input order
 
-    def _is_hl7v2_format(self, data: Dict[str, Any]) -> bool:
-        """Check if data is in HL7 v2 format"""
-        return (
-            isinstance(data, dict) and
-            "MSH" in data and
-            "PID" in data and
-            "DG1" in data
-        )
+        At most ``concurrency`` claims are in flight at once; claims whose
+        references are cached (and non-FHIR claims) complete without
+        yielding, so only cache misses wait on reference resolution. As with
+        validate_claim, the first invalid claim raises ValueError.
+        """
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+        semaphore = asyncio.Semaphore(concurrency)
 
-    def _is_sbs_format(self, data: Dict[str, Any]) -> bool:
-        """Check if data is in Saudi Billing Standard format"""
-        return (
-            isinstance(data, dict) and
-            data.get("billing_standard") == "SBS" and
-            "patient_info" in data and
-            "provider_info" in data
-        )
+        async def validate_one(claim_data):
+            async with semaphore:
+                return await self.validate_claim(claim_data)
 
-    async def _convert_fhir_to_claim(self, fhir_data: Dict[str, Any]) -> Claim:
-        """Convert FHIR R4 Claim resource to internal Claim model"""
+        return await asyncio.gather(*(validate_one(claim_data) for claim_data in batch))
+
+    async def validate_batch(
+        self, buffers: List[Union[bytes, bytearray, memoryview]], concurrency: int = 32
+    ) -> List[Claim]:
+        """
+        Validate a claim file's raw JSON claims, returning them in input order
+
+        Every buffer is decoded up front, so a malformed claim fails the batch
+        before any reference is fetched; conversion then runs as in
+        validate_claims.
+        """
+        batch = [self._decode_claim_json(buffer) for buffer in buffers]
+        return await self.validate_claims(batch, concurrency)
+
+    def _detect_format(self, data: Dict[str, Any]) -> str:
+        """Classify claims as FHIR R4, HL7 v2, SBS (Saudi Billing Standard) or custom
+        
+        Each format is recognised by one discriminating key, checked before
+        its remaining required keys (in FHIR, HL7 v2, SBS precedence);
+        anything else falls through to custom.
+        """
+        if not isinstance(data, dict):
+            return FORMAT_CUSTOM
+        if data.get("resourceType") == "Claim":
+            meta = data.get("meta")
+            if meta and meta.get("versionId") is not None:
+                return FORMAT_FHIR
+        if "MSH" in data:
+            if "PID" in data and "DG1" in data:
+                return FORMAT_HL7V2
+        if data.get("billing_standard") == "SBS":
+            if "patient_info" in data and "provider_info" in data:
+                return FORMAT_SBS
+        return FORMAT_CUSTOM
+
+    async def _resolve_references(
+        self, fhir_data: Dict[str, Any]
+    ) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Resolve a FHIR claim's (patient, provider) references
+        
+        Cache hits return without awaiting; otherwise both references are
+        fetched concurrently.
+        """
+        patient_reference = fhir_data.get("patient", _EMPTY).get("reference", "")
+        provider_reference = fhir_data.get("provider", _EMPTY).get("reference", "")
+        patient_data = self._patient_loader.get_cached(patient_reference)
+        provider_data = self._provider_loader.get_cached(provider_reference)
+        if patient_data is None or provider_data is None:
+            patient_data, provider_data = await asyncio.gather(
+                self._patient_loader.load(patient_reference),
+                self._provider_loader.load(provider_reference),
+            )
+        return patient_data, provider_data
+
+    def _convert_fhir_to_claim(
+        self,
+        fhir_data: Dict[str, Any],
+        now: datetime,
+        patient_data: Dict[str, Any],
+        provider_data: Dict[str, Any],
+    ) -> Claim:
+        """Convert a FHIR R4 Claim (with resolved references) to the Claim model"""
         
         # Extract patient information
-        patient_reference = fhir_data.get("patient", {}).get("reference", "")
-        patient_data = await self._resolve_patient_reference(patient_reference)
+        patient_ids = self._classify_identifiers(patient_data.get("identifier", []))
         
         patient = Patient(
             id=patient_data.get("id", ""),
-            national_id=self._extract_national_id(patient_data),
+            national_id=patient_ids.get("nid", ""),
             name=self._extract_patient_name(patient_data),
             arabic_name=self._extract_patient_name(patient_data, language="ar"),
-            date_of_birth=datetime.fromisoformat(patient_data.get("birthDate", "1970-01-01")),
+            date_of_birth=_parse_iso_or(patient_data.get("birthDate"), _DEFAULT_DOB),
             gender=patient_data.get("gender", "unknown"),
-            insurance_id=self._extract_insurance_id(patient_data)
+            insurance_id=patient_ids.get("ins", "")
         )
 
         # Extract provider information
-        provider_reference = fhir_data.get("provider", {}).get("reference", "")
-        provider_data = await self._resolve_provider_reference(provider_reference)
+        provider_ids = self._classify_identifiers(provider_data.get("identifier", []))
         
         provider = Provider(
             id=provider_data.get("id", ""),
             name=self._extract_provider_name(provider_data),
             arabic_name=self._extract_provider_name(provider_data, language="ar"),
-            license_number=self._extract_license_number(provider_data),
+            license_number=provider_ids.get("lic", ""),
             specialty=self._extract_specialty(provider_data),
-            nphies_provider_id=self._extract_nphies_id(provider_data)
+            nphies_provider_id=provider_ids.get("nph", "")
         )
 
+        # Diagnoses first: items reference them by sequence number
+        diagnoses = self._scan_diagnoses(fhir_data)
+        
         # Extract claim items
         items = []
-        for i, item in enumerate(fhir_data.get("item", [])):
+        for sequence, item in enumerate(fhir_data.get("item", ()), 1):
             claim_item = ClaimItem(
-                sequence=item.get("sequence", i + 1),
+                sequence=item.get("sequence", sequence),
                 procedure_code=self._extract_procedure_code(item),
-                diagnosis_codes=self._extract_diagnosis_codes(item),
-                quantity=item.get("quantity", {}).get("value", 1),
-                unit_price=float(item.get("unitPrice", {}).get("value", 0)),
-                total_amount=float(item.get("net", {}).get("value", 0)),
-                service_date=datetime.fromisoformat(
-                    item.get("servicedDate", datetime.now().isoformat())
-                )
+                diagnosis_codes=self._extract_diagnosis_codes(
+                    item, diagnoses.by_sequence
+                ),
+                quantity=item.get("quantity", _EMPTY).get("value", 1),
+                unit_price=float(item.get("unitPrice", _EMPTY).get("value", 0)),
+                total_amount=float(item.get("net", _EMPTY).get("value", 0)),
+                service_date=_parse_iso_or(item.get("servicedDate"), now)
             )
             items.append(claim_item)
 
-        # Extract diagnoses
-        primary_diagnosis = self._extract_primary_diagnosis(fhir_data)
-        secondary_diagnoses = self._extract_secondary_diagnoses(fhir_data)
-
         # Create claim object
         claim = Claim(
             id=fhir_data.get("id", ""),
             tenant_id=self._extract_tenant_id(fhir_data),
-            claim_number=fhir_data.get("identifier", [{}])[0].get("value", ""),
+            claim_number=fhir_data.get("identifier", _EMPTY_LIST)[0].get("value", ""),
             patient=patient,
             provider=provider,
-            total_amount=float(fhir_data.get("total", {}).get("value", 0)),
+            total_amount=float(fhir_data.get("total", _EMPTY).get("value", 0)),
             items=items,
-            primary_diagnosis=primary_diagnosis,
-            secondary_diagnoses=secondary_diagnoses,
-            service_period=self._extract_service_period(fhir_data),
+            primary_diagnosis=diagnoses.primary,
+            secondary_diagnoses=diagnoses.secondary,
+            service_period=self._extract_service_period(fhir_data, now),
             insurance_plan=self._extract_insurance_plan(fhir_data),
             policy_number=self._extract_policy_number(fhir_data),
             nphies_claim_id=fhir_data.get("id")
@@ -150,14 +566,16 @@ class FHIRConverter:
 
         return claim
 
-    async def _convert_hl7v2_to_claim(self, hl7_data: Dict[str, Any]) -> Claim:
+    def _convert_hl7v2_to_claim(self, hl7_data: Dict[str, Any], now: datetime) -> Claim:
         """Convert HL7 v2 message to internal Claim model"""
         
         # Extract patient from PID segment
-        pid_segment = hl7_data.get("PID", {})
+        pid_segment = hl7_data.get("PID", _EMPTY)
         patient = Patient(
             id=pid_segment.get("patient_id", ""),
-            national_id=pid_segment.get("patient_identifier_list", [{}])[0].get("id", ""),
+            national_id=(
+                pid_segment.get("patient_identifier_list", _EMPTY_LIST)[0].get("id", "")
+            ),
             name=self._format_hl7_name(pid_segment.get("patient_name", [])),
             date_of_birth=self._parse_hl7_date(pid_segment.get("date_time_of_birth")),
             gender=pid_segment.get("administrative_sex", "unknown").lower(),
@@ -165,10 +583,12 @@ class FHIRConverter:
         )
 
         # Extract provider from PV1 segment
-        pv1_segment = hl7_data.get("PV1", {})
+        attending_doctor = (
+            hl7_data.get("PV1", _EMPTY).get("attending_doctor", _EMPTY_LIST)
+        )
         provider = Provider(
-            id=pv1_segment.get("attending_doctor", [{}])[0].get("id_number", ""),
-            name=self._format_hl7_name(pv1_segment.get("attending_doctor", [])),
+            id=attending_doctor[0].get("id_number", ""),
+            name=self._format_hl7_name(attending_doctor),
             license_number="",  # Not typically in HL7 v2
             specialty="",
             nphies_provider_id=""
@@ -178,21 +598,20 @@ class FHIRConverter:
         diagnoses = []
         for dg1 in hl7_data.get("DG1", []):
             diagnosis = DiagnosisCode(
-                code=dg1.get("diagnosis_code_dg1", {}).get("identifier", ""),
+                code=dg1.get("diagnosis_code_dg1", _EMPTY).get("identifier", ""),
                 system="ICD-10",  # Assume ICD-10
                 display=dg1.get("diagnosis_description", "")
             )
             diagnoses.append(diagnosis)
 
-        primary_diagnosis = diagnoses[0] if diagnoses else DiagnosisCode(
-            code="Z00.00", system="ICD-10", display="Encounter for general examination"
-        )
+        primary_diagnosis = diagnoses[0] if diagnoses else _HL7_PLACEHOLDER_DX
         
         # Create basic claim structure
+        message_control_id = hl7_data.get("MSH", _EMPTY).get("message_control_id", "")
         claim = Claim(
-            id=hl7_data.get("MSH", {}).get("message_control_id", ""),
+            id=message_control_id,
             tenant_id="default",  # Will be set by calling service
-            claim_number=f"HL7-{hl7_data.get('MSH', {}).get('message_control_id', '')}",
+            claim_number=f"HL7-{message_control_id}",
             patient=patient,
             provider=provider,
             total_amount=0.0,  # Will be calculated from items
@@ -200,8 +619,8 @@ class FHIRConverter:
             primary_diagnosis=primary_diagnosis,
             secondary_diagnoses=diagnoses[1:],
             service_period={
-                "start": datetime.now(),
-                "end": datetime.now()
+                "start": now,
+                "end": now
             },
             insurance_plan="default",
             policy_number=""
@@ -209,127 +628,58 @@ class FHIRConverter:
 
         return claim
 
-    async def _convert_sbs_to_claim(self, sbs_data: Dict[str, Any]) -> Claim:
-        """Convert Saudi Billing Standard format to internal Claim model"""
+    def _convert_sbs_to_claim(self, sbs_data: Dict[str, Any], now: datetime) -> Claim:
+        """Convert Saudi Billing Standard format to internal Claim model
         
-        patient_info = sbs_data.get("patient_info", {})
-        patient = Patient(
-            id=patient_info.get("patient_id", ""),
-            national_id=patient_info.get("national_id", ""),
-            name=patient_info.get("name_en", ""),
-            arabic_name=patient_info.get("name_ar", ""),
-            date_of_birth=datetime.fromisoformat(patient_info.get("date_of_birth", "1970-01-01")),
-            gender=patient_info.get("gender", "unknown"),
-            insurance_id=patient_info.get("insurance_number", "")
-        )
-
-        provider_info = sbs_data.get("provider_info", {})
-        provider = Provider(
-            id=provider_info.get("provider_id", ""),
-            name=provider_info.get("name_en", ""),
-            arabic_name=provider_info.get("name_ar", ""),
-            license_number=provider_info.get("license_number", ""),
-            specialty=provider_info.get("specialty", ""),
-            nphies_provider_id=provider_info.get("nphies_id", "")
-        )
-
-        # Convert SBS items to claim items
-        items = []
-        for sbs_item in sbs_data.get("billing_items", []):
-            item = ClaimItem(
-                sequence=sbs_item.get("line_number", 1),
-                procedure_code=ProcedureCode(
-                    code=sbs_item.get("procedure_code", ""),
-                    system="SBS",
-                    display=sbs_item.get("procedure_description", ""),
-                    arabic_display=sbs_item.get("procedure_description_ar", ""),
-                    cost=float(sbs_item.get("unit_price", 0))
-                ),
+        Fields are read by extractors compiled from the SBS_*_SPEC mappings
+        and models are built with model_construct (no validation); numeric
+        fields are converted explicitly. Set strict_validate to re-validate.
+        """
+        extract_item = self._sbs_item
+        extract_procedure = self._sbs_procedure
+        items = [
+            extract_item(
+                sbs_item,
+                procedure_code=extract_procedure(sbs_item),
                 diagnosis_codes=[],  # Will be populated from diagnosis section
-                quantity=int(sbs_item.get("quantity", 1)),
-                unit_price=float(sbs_item.get("unit_price", 0)),
-                total_amount=float(sbs_item.get("total_amount", 0)),
-                service_date=datetime.fromisoformat(sbs_item.get("service_date", datetime.now().isoformat()))
+                service_date=_parse_iso_or(sbs_item.get("service_date"), now),
             )
-            items.append(item)
-
-        # Extract diagnoses
-        primary_diagnosis = DiagnosisCode(
-            code=sbs_data.get("primary_diagnosis", {}).get("code", ""),
-            system="ICD-10",
-            display=sbs_data.get("primary_diagnosis", {}).get("description", ""),
-            arabic_display=sbs_data.get("primary_diagnosis", {}).get("description_ar", "")
-        )
+            for sbs_item in sbs_data.get("billing_items", ())
+        ]
 
-        claim = Claim(
-            id=sbs_data.get("claim_id", ""),
-            tenant_id="default",
-            claim_number=sbs_data.get("claim_number", ""),
-            patient=patient,
-            provider=provider,
-            total_amount=float(sbs_data.get("total_amount", 0)),
+        return self._sbs_claim(
+            sbs_data,
+            patient=self._sbs_patient(sbs_data),
+            provider=self._sbs_provider(sbs_data),
             items=items,
-            primary_diagnosis=primary_diagnosis,
+            primary_diagnosis=self._sbs_diagnosis(sbs_data),
             secondary_diagnoses=[],
             service_period={
-                "start": datetime.fromisoformat(sbs_data.get("service_start_date", datetime.now().isoformat())),
-                "end": datetime.fromisoformat(sbs_data.get("service_end_date", datetime.now().isoformat()))
+                "start": _parse_iso_or(sbs_data.get("service_start_date"), now),
+                "end": _parse_iso_or(sbs_data.get("service_end_date"), now)
             },
-            insurance_plan=sbs_data.get("insurance_plan", ""),
-            policy_number=sbs_data.get("policy_number", "")
         )
 
-        return claim
-
-    async def _convert_custom_to_claim(self, custom_data: Dict[str, Any]) -> Claim:
-        """Convert custom format to internal Claim model"""
+    def _convert_custom_to_claim(
+        self, custom_data: Dict[str, Any], now: datetime
+    ) -> Claim:
+        """Convert custom format to the Claim model (compiled extractors, as SBS)"""
         # This would handle any custom format specific to the implementation
-        # For now, assume a simplified structure similar to our internal model
-        
-        patient = Patient(
-            id=custom_data.get("patient", {}).get("id", ""),
-            national_id=custom_data.get("patient", {}).get("national_id", ""),
-            name=custom_data.get("patient", {}).get("name", ""),
-            date_of_birth=datetime.fromisoformat(
-                custom_data.get("patient", {}).get("date_of_birth", "1970-01-01")
-            ),
-            gender=custom_data.get("patient", {}).get("gender", "unknown"),
-            insurance_id=custom_data.get("patient", {}).get("insurance_id", "")
-        )
-
-        provider = Provider(
-            id=custom_data.get("provider", {}).get("id", ""),
-            name=custom_data.get("provider", {}).get("name", ""),
-            license_number=custom_data.get("provider", {}).get("license", ""),
-            specialty=custom_data.get("provider", {}).get("specialty", ""),
-            nphies_provider_id=custom_data.get("provider", {}).get("nphies_id", "")
-        )
-
-        # Create a basic claim
-        claim = Claim(
-            id=custom_data.get("id", ""),
-            tenant_id=custom_data.get("tenant_id", "default"),
-            claim_number=custom_data.get("claim_number", ""),
-            patient=patient,
-            provider=provider,
-            total_amount=float(custom_data.get("total_amount", 0)),
+        # For now, assume a simplified structure similar to our internal model;
+        # a tenant-specific format would get its own CUSTOM_*_SPEC mappings
+        return self._custom_claim(
+            custom_data,
+            patient=self._custom_patient(custom_data),
+            provider=self._custom_provider(custom_data),
             items=[],  # Simplified for demo
-            primary_diagnosis=DiagnosisCode(
-                code="Z00.00",
-                system="ICD-10", 
-                display="General examination"
-            ),
+            primary_diagnosis=_PLACEHOLDER_DX,
             secondary_diagnoses=[],
             service_period={
-                "start": datetime.now(),
-                "end": datetime.now()
+                "start": now,
+                "end": now
             },
-            insurance_plan=custom_data.get("insurance_plan", ""),
-            policy_number=custom_data.get("policy_number", "")
         )
 
-        return claim
-
     # Helper methods for data extraction
     async def _resolve_patient_reference(self, reference: str) -> Dict[str, Any]:
         """Resolve patient reference to patient data"""
@@ -341,12 +691,20 @@ class FHIRConverter:
         # In production, this would fetch from FHIR server
         return {"id": reference.split("/")[-1]}
 
-    def _extract_national_id(self, patient_data: Dict[str, Any]) -> str:
-        """Extract Saudi national ID from patient identifiers"""
-        for identifier in patient_data.get("identifier", []):
-            if identifier.get("system") == "http://nphies.sa/identifier/national-id":
-                return identifier.get("value", "")
-        return ""
+    def _classify_identifiers(
+        self, identifiers: List[Dict[str, Any]]
+    ) -> Dict[str, str]:
+        """Map identifier families ("nid", "ins", "lic", "nph") to their first value
+        
+        One pass over the identifiers with memoized system classification; an
+        identifier may fill several families (national-id URLs contain "nphies").
+        """
+        ids: Dict[str, str] = {}
+        for identifier in identifiers:
+            for family in _identifier_families(identifier.get("system") or ""):
+                if family not in ids:
+                    ids[family] = identifier.get("value", "")
+        return ids
 
     def _extract_patient_name(self, patient_data: Dict[str, Any], language: str = "en") -> str:
         """Extract patient name in specified language"""
@@ -354,123 +712,110 @@ class FHIRConverter:
             if language == "ar" and name.get("extension"):
                 # Look for Arabic name extension
                 for ext in name.get("extension", []):
-                    if "arabic" in ext.get("url", "").lower():
+                    if ext.get("url") in ARABIC_EXT_URLS:
                         return ext.get("valueString", "")
             elif language == "en":
-                return " ".join([
-                    " ".join(name.get("given", [])),
-                    " ".join(name.get("family", []))
-                ]).strip()
-        return ""
-
-    def _extract_insurance_id(self, patient_data: Dict[str, Any]) -> str:
-        """Extract insurance member ID"""
-        for identifier in patient_data.get("identifier", []):
-            if "insurance" in identifier.get("system", "").lower():
-                return identifier.get("value", "")
+                given = name.get("given") or ()
+                family = name.get("family") or ()
+                if family.__class__ is str:
+                    # FHIR R4 HumanName.family is a single string
+                    return f"{' '.join(given)} {family}".strip()
+                if len(given) == 1 and len(family) == 1:
+                    return f"{given[0]} {family[0]}".strip()
+                return f"{' '.join(given)} {' '.join(family)}".strip()
         return ""
 
     def _extract_provider_name(self, provider_data: Dict[str, Any], language: str = "en") -> str:
         """Extract provider name"""
         # Similar to patient name extraction
-        return provider_data.get("name", [{}])[0].get("text", "")
-
-    def _extract_license_number(self, provider_data: Dict[str, Any]) -> str:
-        """Extract medical license number"""
-        for identifier in provider_data.get("identifier", []):
-            if "license" in identifier.get("system", "").lower():
-                return identifier.get("value", "")
-        return ""
+        return provider_data.get("name", _EMPTY_LIST)[0].get("text", "")
 
     def _extract_specialty(self, provider_data: Dict[str, Any]) -> str:
         """Extract provider specialty"""
         qualifications = provider_data.get("qualification", [])
         if qualifications:
-            return qualifications[0].get("code", {}).get("text", "")
-        return ""
-
-    def _extract_nphies_id(self, provider_data: Dict[str, Any]) -> str:
-        """Extract NPHIES provider ID"""
-        for identifier in provider_data.get("identifier", []):
-            if "nphies" in identifier.get("system", "").lower():
-                return identifier.get("value", "")
+            return qualifications[0].get("code", _EMPTY).get("text", "")
         return ""
 
     def _extract_procedure_code(self, item: Dict[str, Any]) -> ProcedureCode:
         """Extract procedure code from claim item"""
-        product_or_service = item.get("productOrService", {})
+        coding = item.get("productOrService", _EMPTY).get("coding", _EMPTY_LIST)[0]
         return ProcedureCode(
-            code=product_or_service.get("coding", [{}])[0].get("code", ""),
-            system=product_or_service.get("coding", [{}])[0].get("system", ""),
-            display=product_or_service.get("coding", [{}])[0].get("display", "")
+            code=coding.get("code", ""),
+            system=coding.get("system", ""),
+            display=coding.get("display", "")
         )
 
-    def _extract_diagnosis_codes(self, item: Dict[str, Any]) -> List[DiagnosisCode]:
-        """Extract diagnosis codes from claim item"""
+    def _extract_diagnosis_codes(
+        self, item: Dict[str, Any], by_sequence: Dict[int, DiagnosisCode]
+    ) -> List[DiagnosisCode]:
+        """Resolve a claim item's diagnosisSequence against the claim's diagnoses"""
         diagnoses = []
-        for diagnosis_ref in item.get("diagnosisSequence", []):
-            # In production, resolve diagnosis reference
-            diagnoses.append(DiagnosisCode(
-                code="Z00.00",
-                system="ICD-10",
-                display="General examination"
-            ))
+        for sequence in item.get("diagnosisSequence", ()):
+            diagnosis = by_sequence.get(sequence)
+            if diagnosis is None:
+                # Dangling sequence: keep the placeholder used before resolution existed
+                diagnosis = _PLACEHOLDER_DX
+            diagnoses.append(diagnosis)
         return diagnoses
 
-    def _extract_primary_diagnosis(self, fhir_data: Dict[str, Any]) -> DiagnosisCode:
-        """Extract primary diagnosis from FHIR claim"""
-        diagnoses = fhir_data.get("diagnosis", [])
-        for diagnosis in diagnoses:
-            if diagnosis.get("type", [{}])[0].get("coding", [{}])[0].get("code") == "principal":
-                diagnosis_code = diagnosis.get("diagnosisCodeableConcept", {})
-                return DiagnosisCode(
-                    code=diagnosis_code.get("coding", [{}])[0].get("code", ""),
-                    system=diagnosis_code.get("coding", [{}])[0].get("system", ""),
-                    display=diagnosis_code.get("coding", [{}])[0].get("display", "")
-                )
+    def _scan_diagnoses(self, fhir_data: Dict[str, Any]) -> _DiagnosisScan:
+        """Collect primary, secondary and by-sequence diagnoses in one pass
         
-        # Default if no primary diagnosis found
-        return DiagnosisCode(code="Z00.00", system="ICD-10", display="General examination")
-
-    def _extract_secondary_diagnoses(self, fhir_data: Dict[str, Any]) -> List[DiagnosisCode]:
-        """Extract secondary diagnoses from FHIR claim"""
-        secondary_diagnoses = []
-        diagnoses = fhir_data.get("diagnosis", [])
+        The first "principal" diagnosis is primary; other principal entries
+        are only indexed by sequence, and every non-principal diagnosis is
+        secondary. Entries without a sequence use their 1-based position.
+        """
+        scan = _DiagnosisScan()
         
-        for diagnosis in diagnoses:
-            if diagnosis.get("type", [{}])[0].get("coding", [{}])[0].get("code") != "principal":
-                diagnosis_code = diagnosis.get("diagnosisCodeableConcept", {})
-                secondary_diagnoses.append(DiagnosisCode(
-                    code=diagnosis_code.get("coding", [{}])[0].get("code", ""),
-                    system=diagnosis_code.get("coding", [{}])[0].get("system", ""),
-                    display=diagnosis_code.get("coding", [{}])[0].get("display", "")
-                ))
+        for position, diagnosis in enumerate(fhir_data.get("diagnosis", ()), 1):
+            concept = diagnosis.get("diagnosisCodeableConcept") or _EMPTY
+            coding = concept.get("coding") or _EMPTY_LIST
+            c0 = coding[0]
+            diagnosis_code = DiagnosisCode(
+                code=c0.get("code", ""),
+                system=c0.get("system", ""),
+                display=c0.get("display", "")
+            )
+            scan.by_sequence[diagnosis.get("sequence", position)] = diagnosis_code
+            
+            diagnosis_type = (diagnosis.get("type") or _EMPTY_LIST)[0]
+            type_coding = diagnosis_type.get("coding") or _EMPTY_LIST
+            if type_coding[0].get("code") != "principal":
+                scan.secondary.append(diagnosis_code)
+            elif scan.primary is None:
+                scan.primary = diagnosis_code
         
-        return secondary_diagnoses
-
-    def _extract_service_period(self, fhir_data: Dict[str, Any]) -> Dict[str, datetime]:
-        """Extract service period from FHIR claim"""
-        billable_period = fhir_data.get("billablePeriod", {})
+        if scan.primary is None:
+            # Default if no primary diagnosis found
+            scan.primary = _PLACEHOLDER_DX
+        return scan
+
+    def _extract_service_period(
+        self, fhir_data: Dict[str, Any], now: datetime
+    ) -> Dict[str, datetime]:
+        """Extract service period from FHIR claim; missing bounds default to ``now``"""
+        billable_period = fhir_data.get("billablePeriod", _EMPTY)
         return {
-            "start": datetime.fromisoformat(billable_period.get("start", datetime.now().isoformat())),
-            "end": datetime.fromisoformat(billable_period.get("end", datetime.now().isoformat()))
+            "start": _parse_iso_or(billable_period.get("start"), now),
+            "end": _parse_iso_or(billable_period.get("end"), now)
         }
 
     def _extract_insurance_plan(self, fhir_data: Dict[str, Any]) -> str:
         """Extract insurance plan from FHIR claim"""
-        insurance = fhir_data.get("insurance", [{}])[0]
-        coverage_ref = insurance.get("coverage", {}).get("reference", "")
+        insurance = fhir_data.get("insurance", _EMPTY_LIST)[0]
+        coverage_ref = insurance.get("coverage", _EMPTY).get("reference", "")
         return coverage_ref.split("/")[-1] if coverage_ref else ""
 
     def _extract_policy_number(self, fhir_data: Dict[str, Any]) -> str:
         """Extract policy number from FHIR claim"""
         # This would typically be in the Coverage resource
-        return fhir_data.get("identifier", [{}])[0].get("value", "")
+        return fhir_data.get("identifier", _EMPTY_LIST)[0].get("value", "")
 
     def _extract_tenant_id(self, fhir_data: Dict[str, Any]) -> str:
         """Extract tenant ID from FHIR data"""
         # Look for tenant identifier in meta or identifier
-        meta = fhir_data.get("meta", {})
+        meta = fhir_data.get("meta", _EMPTY)
         for tag in meta.get("tag", []):
             if tag.get("system") == "http://brainsait.com/tenant-id":
                 return tag.get("code", "")
@@ -487,13 +832,15 @@ class FHIRConverter:
     def _parse_hl7_date(self, date_string: Optional[str]) -> datetime:
         """Parse HL7 v2 date format"""
         if not date_string:
-            return datetime(1970, 1, 1)
+            return _DEFAULT_DOB
         
-        try:
-            # HL7 date format: YYYYMMDD or YYYYMMDDHHMMSS
-            if len(date_string) >= 8:
-                return datetime.strptime(date_string[:8], "%Y%m%d")
-        except ValueError:
-            pass
+        # HL7 date format: YYYYMMDD or YYYYMMDDHHMMSS; the date part is
+        # sliced into integers directly instead of going through strptime
+        digits = date_string[:8]
+        if len(digits) == 8 and digits.isdigit():
+            try:
+                return datetime(int(digits[:4]), int(digits[4:6]), int(digits[6:]))
+            except ValueError:  # out-of-range month/day
+                pass
         
-        return datetime(1970, 1, 1)
\ No newline at end of file
+        return _DEFAULT_DOB
\ No newline at end of file
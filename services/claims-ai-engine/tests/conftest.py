@@ -0,0 +1,19 @@
+"""Shared test setup."""
+
+import importlib.util
+import sys
+import types
+from pathlib import Path
+
+# The claim models are not part of this service's tree in every checkout;
+# stand in for them so the processor and converter tests still run
+if importlib.util.find_spec("src.models") is None:
+    _spec = importlib.util.spec_from_file_location(
+        "src.models.claim", Path(__file__).parent / "stubs" / "claim_models.py"
+    )
+    _claim_models = importlib.util.module_from_spec(_spec)
+    _spec.loader.exec_module(_claim_models)
+    _models = types.ModuleType("src.models")
+    _models.claim = _claim_models
+    sys.modules["src.models"] = _models
+    sys.modules["src.models.claim"] = _claim_models
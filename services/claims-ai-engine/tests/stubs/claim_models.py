@@ -0,0 +1,59 @@
+"""Minimal stand-in for ``src.models.claim``, used when the models are absent.
+
+Only the names the service imports are provided. The models accept any
+fields, so tests exercise the converters and processor without the real
+schema.
+"""
+
+from enum import Enum
+
+from pydantic import BaseModel, ConfigDict
+
+
+class _ClaimModel(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+
+class Patient(_ClaimModel):
+    pass
+
+
+class Provider(_ClaimModel):
+    pass
+
+
+class DiagnosisCode(_ClaimModel):
+    pass
+
+
+class ProcedureCode(_ClaimModel):
+    pass
+
+
+class ClaimItem(_ClaimModel):
+    pass
+
+
+class Claim(_ClaimModel):
+    pass
+
+
+class ClaimResult(_ClaimModel):
+    pass
+
+
+class ClaimMetrics(_ClaimModel):
+    pass
+
+
+class ClaimStatus(str, Enum):
+    PENDING = "pending"
+    PROCESSING = "processing"
+    APPROVED = "approved"
+    DENIED = "denied"
+
+
+class ClaimDecision(str, Enum):
+    AUTO_APPROVE = "auto_approve"
+    AUTO_DENY = "auto_deny"
+    MANUAL_REVIEW = "manual_review"
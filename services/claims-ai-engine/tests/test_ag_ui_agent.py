@@ -0,0 +1,406 @@
+"""Tests for the /analyze micro-batcher and in-flight deduplication."""
+
+import asyncio
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+from typing import Any, Dict, List
+
+import pytest
+
+from src import ag_ui_agent as agent
+from src.ag_ui_agent import (
+    ClaimsBatcher,
+    NphiesAgentDeps,
+    NphiesResponse,
+    NphiesSetResponse,
+)
+
+
+def _response(message: str) -> NphiesResponse:
+    return NphiesResponse(status="success", message=message)
+
+
+class FakeAgent:
+    """Stands in for run_agent; answers from the claims the deps expose."""
+
+    def __init__(self, drop_sets: tuple = (), duplicate_sets: tuple = ()):
+        self.runs: List[NphiesAgentDeps] = []
+        self.drop_sets = drop_sets
+        self.duplicate_sets = duplicate_sets
+
+    async def __call__(
+        self, prompt: str, deps: NphiesAgentDeps, output_type: Any = None, **_
+    ):
+        self.runs.append(deps)
+        await asyncio.sleep(0)
+        if output_type is None:
+            return SimpleNamespace(output=_response(f"claims={deps.claims_data}"))
+        outputs = []
+        # Answer in reverse order: results must be matched by claim_set, not position
+        for claim_set in range(len(deps.claim_sets), 0, -1):
+            if claim_set in self.drop_sets:
+                continue
+            message = f"claims={deps.claims_for(claim_set)}"
+            outputs.append(
+                NphiesSetResponse(
+                    status="success", message=message, claim_set=claim_set
+                )
+            )
+            if claim_set in self.duplicate_sets:
+                outputs.append(
+                    NphiesSetResponse(
+                        status="success", message="dup", claim_set=claim_set
+                    )
+                )
+        return SimpleNamespace(output=outputs)
+
+
+@pytest.fixture
+def fake_agent(monkeypatch):
+    fake = FakeAgent()
+    monkeypatch.setattr(agent, "run_agent", fake)
+    return fake
+
+
+@pytest.fixture(autouse=True)
+def fresh_analysis_state(monkeypatch):
+    monkeypatch.setattr(agent, "analyze_cache", agent.ResponseCache(100, 60))
+    monkeypatch.setattr(agent, "inflight_analyses", {})
+
+
+def _request(tenant: str, *claims: int) -> Dict[str, Any]:
+    return {"tenant_id": tenant, "claims_data": [{"claim_id": c} for c in claims]}
+
+
+async def _submit_all(
+    batcher: ClaimsBatcher, requests: List[Dict[str, Any]]
+) -> List[NphiesResponse]:
+    try:
+        return await asyncio.gather(*(batcher.submit(r) for r in requests))
+    finally:
+        await batcher.stop()
+
+
+async def test_batcher_scatters_results_to_their_requests(fake_agent):
+    requests = [_request("t1", 1), _request("t1", 2, 3), _request("t1", 4)]
+
+    outputs = await _submit_all(ClaimsBatcher(max_batch=8, max_wait_ms=50), requests)
+
+    assert [o.message for o in outputs] == [
+        f"claims={r['claims_data']}" for r in requests
+    ]
+    assert all(type(o) is NphiesResponse for o in outputs)
+    assert len(fake_agent.runs) == 1
+    assert fake_agent.runs[0].claim_sets == [r["claims_data"] for r in requests]
+    assert fake_agent.runs[0].claims_data == []
+
+
+async def test_batcher_never_mixes_tenants(fake_agent):
+    requests = [_request("t1", 1), _request("t2", 2), _request("t1", 3)]
+
+    outputs = await _submit_all(ClaimsBatcher(max_batch=8, max_wait_ms=50), requests)
+
+    assert [o.message for o in outputs] == [
+        f"claims={r['claims_data']}" for r in requests
+    ]
+    seen = sorted(
+        (run.claim_sets or [run.claims_data] for run in fake_agent.runs), key=len
+    )
+    assert seen == [
+        [requests[1]["claims_data"]],
+        [requests[0]["claims_data"], requests[2]["claims_data"]],
+    ]
+
+
+@pytest.mark.parametrize(
+    "fake", [FakeAgent(drop_sets=(2,)), FakeAgent(duplicate_sets=(2,))]
+)
+async def test_batcher_reruns_sets_not_answered_exactly_once(monkeypatch, fake):
+    monkeypatch.setattr(agent, "run_agent", fake)
+    requests = [_request("t1", 1), _request("t1", 2), _request("t1", 3)]
+
+    outputs = await _submit_all(ClaimsBatcher(max_batch=8, max_wait_ms=50), requests)
+
+    assert [o.message for o in outputs] == [
+        f"claims={r['claims_data']}" for r in requests
+    ]
+    assert [run.claims_data for run in fake.runs[1:]] == [requests[1]["claims_data"]]
+
+
+async def test_batcher_propagates_agent_errors(monkeypatch):
+    async def failing_agent(*_, **__):
+        raise RuntimeError("model unavailable")
+
+    monkeypatch.setattr(agent, "run_agent", failing_agent)
+    batcher = ClaimsBatcher(max_batch=8, max_wait_ms=50)
+
+    results = await asyncio.gather(
+        *(batcher.submit(_request("t1", i)) for i in range(3)), return_exceptions=True
+    )
+    await batcher.stop()
+
+    assert [str(r) for r in results] == ["model unavailable"] * 3
+
+
+async def test_batcher_stop_fails_queued_requests(fake_agent):
+    batcher = ClaimsBatcher(max_batch=8, max_wait_ms=60_000)
+    tasks = [asyncio.create_task(batcher.submit(_request("t1", i))) for i in range(3)]
+    await asyncio.sleep(0.01)
+
+    await batcher.stop()
+
+    results = await asyncio.wait_for(asyncio.gather(*tasks, return_exceptions=True), 1)
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert fake_agent.runs == []
+
+
+def test_claim_sets_are_isolated_in_deps():
+    deps = NphiesAgentDeps.model_construct(
+        claim_sets=[[{"amount": 60_000}], [{"amount": 10}, {"amount": 20}]]
+    )
+
+    assert deps.claims_for(2) == [{"amount": 10}, {"amount": 20}]
+    assert deps.claims_soa_for(1)["amount"].tolist() == [60_000]
+    assert deps.claims_soa_for(2)["amount"].tolist() == [10, 20]
+    for claim_set in (None, 0, 3):
+        with pytest.raises(ValueError):
+            deps.claims_for(claim_set)
+
+
+async def test_cached_tool_keys_on_the_callers_claim_set():
+    calls = []
+
+    @agent.cached_tool(ttl=60)
+    async def count_claims(ctx, label: str = "x", claim_set=None):
+        calls.append(claim_set)
+        return len(ctx.deps.claims_for(claim_set))
+
+    ctx = SimpleNamespace(
+        deps=NphiesAgentDeps.model_construct(claim_sets=[[1, 2], [3]])
+    )
+
+    assert await count_claims(ctx, claim_set=1) == 2
+    assert await count_claims(ctx, claim_set=2) == 1
+    assert await count_claims(ctx, claim_set=1) == 2
+    assert "claim_set" in await count_claims(ctx, claim_set=5)
+    assert calls == [1, 2]
+
+
+class Leader:
+    """Controls the one agent call run_analysis makes per cache key."""
+
+    def __init__(self):
+        self.calls = 0
+        self.release = asyncio.Event()
+        self.error: Exception | None = None
+
+    async def submit(self, request: Dict[str, Any]) -> NphiesResponse:
+        self.calls += 1
+        call = self.calls
+        await self.release.wait()
+        if self.error is not None:
+            raise self.error
+        return _response(f"call {call}")
+
+
+@pytest.fixture
+def leader(monkeypatch):
+    fake = Leader()
+    monkeypatch.setattr(agent.analyze_batcher, "submit", fake.submit)
+    return fake
+
+
+async def test_concurrent_duplicates_share_one_call(leader):
+    request = _request("t1", 1)
+    tasks = [asyncio.create_task(agent.run_analysis(request)) for _ in range(3)]
+    await asyncio.sleep(0)
+    leader.release.set()
+
+    results = await asyncio.gather(*tasks)
+
+    assert leader.calls == 1
+    assert [r["message"] for r in results] == ["call 1"] * 3
+
+
+async def test_leader_error_reaches_followers(leader):
+    leader.error = RuntimeError("boom")
+    request = _request("t1", 1)
+    tasks = [asyncio.create_task(agent.run_analysis(request)) for _ in range(3)]
+    await asyncio.sleep(0)
+    leader.release.set()
+
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+
+    assert leader.calls == 1
+    assert [str(r) for r in results] == ["boom"] * 3
+    assert agent.inflight_analyses == {}
+
+
+async def test_cancelled_leader_does_not_cancel_followers(leader):
+    request = _request("t1", 1)
+    first = asyncio.create_task(agent.run_analysis(request))
+    await asyncio.sleep(0)
+    followers = [asyncio.create_task(agent.run_analysis(request)) for _ in range(2)]
+    await asyncio.sleep(0)
+
+    first.cancel()
+    await asyncio.sleep(0)
+    leader.release.set()
+    results = await asyncio.gather(*followers)
+
+    assert first.cancelled()
+    # One follower took over as leader; the other joined it
+    assert leader.calls == 2
+    assert [r["message"] for r in results] == ["call 2"] * 2
+
+
+async def test_cancelled_follower_leaves_leader_running(leader):
+    request = _request("t1", 1)
+    first = asyncio.create_task(agent.run_analysis(request))
+    await asyncio.sleep(0)
+    follower = asyncio.create_task(agent.run_analysis(request))
+    await asyncio.sleep(0)
+
+    follower.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await follower
+    leader.release.set()
+
+    assert (await first)["message"] == "call 1"
+    assert leader.calls == 1
+
+
+async def test_analyze_batch_reports_cancelled_items(monkeypatch):
+    async def run_analysis(request):
+        if request["outcome"] == "cancel":
+            raise asyncio.CancelledError()
+        if request["outcome"] == "fail":
+            raise ValueError("bad claims")
+        return {"status": "success"}
+
+    monkeypatch.setattr(agent, "USE_MOCK_RESPONSES", False)
+    monkeypatch.setattr(agent, "run_analysis", run_analysis)
+
+    body = await agent.analyze_batch(
+        [{"outcome": "ok"}, {"outcome": "cancel"}, {"outcome": "fail"}]
+    )
+
+    assert body["results"] == [
+        {"status": "success"},
+        {"status": "error", "message": "Analysis cancelled"},
+        {"status": "error", "message": "Analysis failed: bad claims"},
+    ]
+
+
+def test_session_ids_are_unique_within_a_second():
+    ids = {agent.build_deps({}).session_id for _ in range(3)}
+    ids |= {NphiesAgentDeps().session_id for _ in range(3)}
+
+    assert len(ids) == 6
+
+
+class FakeStreamResult:
+    def __init__(self, parts: int):
+        self.parts = parts
+
+    async def stream_output(self, debounce_by: float = 0):
+        for i in range(self.parts):
+            await asyncio.sleep(0)
+            yield _response(f"part {i}")
+
+    async def get_output(self) -> NphiesResponse:
+        return _response("final")
+
+
+class FakeStreamAgent:
+    """Stands in for nphies_agent.run_stream."""
+
+    def __init__(self, parts: int = 3, error: Exception | None = None):
+        self.calls = 0
+        self.parts = parts
+        self.error = error
+        self.release = asyncio.Event()
+        self.release.set()
+
+    @asynccontextmanager
+    async def run_stream(self, prompt: str, **_):
+        self.calls += 1
+        await self.release.wait()
+        if self.error is not None:
+            raise self.error
+        yield FakeStreamResult(self.parts)
+
+
+@pytest.fixture
+def stream_agent(monkeypatch):
+    fake = FakeStreamAgent()
+    monkeypatch.setattr(agent, "nphies_agent", fake)
+    monkeypatch.setattr(agent, "llm_semaphore", asyncio.Semaphore(1))
+    return fake
+
+
+async def _read_stream(request: Dict[str, Any]) -> List[bytes]:
+    return [event async for event in agent.stream_analysis(request)]
+
+
+async def test_stream_ends_with_the_cached_done_body(stream_agent):
+    request = _request("t1", 1)
+
+    events = await _read_stream(request)
+
+    assert events[0] == agent.sse_event(
+        _response("part 0").model_dump(exclude_none=True)
+    )
+    assert events[-1] == agent.sse_event(
+        agent.analyze_cache.get(agent.analysis_cache_key(request)), "done"
+    )
+    assert b"final" in events[-1]
+    assert await _read_stream(request) == [events[-1]]
+    assert stream_agent.calls == 1
+
+
+async def test_slow_stream_reader_does_not_hold_an_llm_slot(stream_agent):
+    stream_agent.parts = 3 * agent.STREAM_BUFFER
+    stream = agent.stream_analysis(_request("t1", 1))
+
+    first = await stream.__anext__()
+    for _ in range(10 * stream_agent.parts):
+        await asyncio.sleep(0)
+
+    assert not agent.llm_semaphore.locked()
+    rest = [event async for event in stream]
+    # Older partials were dropped for the stalled reader; the end is intact
+    assert 1 + len(rest) <= 2 + agent.STREAM_BUFFER
+    assert b"part 0" in first
+    assert b"done" in rest[-1]
+
+
+async def test_concurrent_streams_share_one_agent_call(stream_agent):
+    stream_agent.release.clear()
+    request = _request("t1", 1)
+    tasks = [asyncio.create_task(_read_stream(request)) for _ in range(2)]
+    tasks.append(asyncio.create_task(agent.run_analysis(request)))
+    await asyncio.sleep(0)
+    stream_agent.release.set()
+
+    leader, follower, joined = await asyncio.gather(*tasks)
+
+    assert stream_agent.calls == 1
+    assert follower == [leader[-1]]
+    assert joined["message"] == "final"
+
+
+async def test_stream_error_reaches_joined_streams(stream_agent):
+    stream_agent.release.clear()
+    stream_agent.error = RuntimeError("model unavailable")
+    request = _request("t1", 1)
+    tasks = [asyncio.create_task(_read_stream(request)) for _ in range(2)]
+    await asyncio.sleep(0)
+    stream_agent.release.set()
+
+    results = await asyncio.gather(*tasks)
+
+    error = {"status": "error", "message": "Analysis failed: model unavailable"}
+    assert stream_agent.calls == 1
+    assert results == [[agent.sse_event(error, "error")]] * 2
+    assert agent.inflight_analyses == {}
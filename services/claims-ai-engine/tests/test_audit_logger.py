@@ -0,0 +1,83 @@
+"""Tests for the audit log client."""
+
+import threading
+
+import orjson
+import pytest
+
+from src.brainsait.audit_logger import audit_dropped_count, audit_log, flush_audit_log
+from src.brainsait.audit_logger import client
+
+
+@pytest.fixture
+def audit_file(monkeypatch, tmp_path):
+    path = tmp_path / "audit.log"
+    monkeypatch.setattr(client, "AUDIT_SINK", "file")
+    monkeypatch.setattr(client, "AUDIT_LOG_PATH", str(path))
+    monkeypatch.setattr(client, "_queue", None)
+    monkeypatch.setattr(client, "_writer", None)
+    monkeypatch.setattr(client, "_dropped", 0)
+    yield path
+    client._close_file()
+
+
+def _log(resource_id: str):
+    return audit_log(
+        action="read",
+        user_id="user-1",
+        resource_type="Claim",
+        resource_id=resource_id,
+        phi_involved=True,
+    )
+
+
+def _written(path) -> list:
+    return [
+        orjson.loads(line)["resource_id"] for line in path.read_bytes().splitlines()
+    ]
+
+
+async def test_records_are_batched_and_flushed(audit_file):
+    _log("a")
+    await _log("b")  # callers of the former coroutine keep working
+
+    assert not audit_file.exists() or _written(audit_file) == []
+    await flush_audit_log()
+    assert _written(audit_file) == ["a", "b"]
+
+
+def test_without_an_event_loop_records_are_written_synchronously(audit_file):
+    _log("sync")
+
+    assert _written(audit_file) == ["sync"]
+
+
+async def test_worker_threads_write_synchronously(audit_file):
+    thread = threading.Thread(target=_log, args=("thread",))
+    thread.start()
+    thread.join()
+
+    assert _written(audit_file) == ["thread"]
+
+
+async def test_overflow_drops_oldest_and_counts(audit_file, monkeypatch):
+    monkeypatch.setattr(client, "AUDIT_QUEUE_MAX", 2)
+
+    for i in range(5):
+        _log(str(i))
+    await flush_audit_log()
+
+    assert _written(audit_file) == ["3", "4"]
+    assert audit_dropped_count() == 3
+
+
+async def test_overflow_write_through_loses_nothing(audit_file, monkeypatch):
+    monkeypatch.setattr(client, "AUDIT_QUEUE_MAX", 2)
+    monkeypatch.setattr(client, "AUDIT_OVERFLOW", "write_through")
+
+    for i in range(5):
+        _log(str(i))
+    await flush_audit_log()
+
+    assert sorted(_written(audit_file)) == ["0", "1", "2", "3", "4"]
+    assert audit_dropped_count() == 0
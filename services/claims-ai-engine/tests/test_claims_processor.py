@@ -0,0 +1,186 @@
+"""Tests for flattened forest inference and prediction micro-batching."""
+
+import asyncio
+import logging
+
+import numpy as np
+import pytest
+
+from src.services import claims_processor
+from src.services.claims_processor import (
+    ClaimsProcessor,
+    FlatForest,
+    PredictionBatcher,
+)
+
+
+@pytest.fixture(scope="module")
+def trained_processor():
+    processor = ClaimsProcessor()
+    asyncio.run(processor._create_demo_models())
+    return processor
+
+
+@pytest.fixture(scope="module")
+def approval_model(trained_processor):
+    return trained_processor.approval_model
+
+
+def _features(n: int, seed: int = 7) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    X = rng.uniform(0, 1, (n, len(claims_processor.FEATURE_COLUMNS)))
+    X[:, claims_processor.COL_CLAIM_AMOUNT] = rng.lognormal(7, 1.5, n)
+    X[:, claims_processor.COL_PATIENT_AGE] = rng.normal(45, 15, n)
+    X[:, claims_processor.COL_PROVIDER_EXPERIENCE] = rng.exponential(5, n)
+    X[:, claims_processor.COL_PROCEDURE_COMPLEXITY] = rng.uniform(1, 10, n)
+    return X.astype(np.float32)
+
+
+def test_flat_forest_matches_predict_proba(approval_model):
+    X = _features(5000)
+    expected = approval_model.predict_proba(X)[:, 1]
+
+    actual = FlatForest(approval_model).predict_positive(X)
+
+    np.testing.assert_allclose(actual, expected, rtol=0, atol=1e-6)
+    # The auto-approve / auto-deny decisions must not change
+    for threshold in (0.15, 0.85):
+        assert np.array_equal(actual >= threshold, expected >= threshold)
+        assert np.array_equal(actual <= threshold, expected <= threshold)
+
+
+def test_flat_forest_single_row(approval_model):
+    X = _features(1)
+
+    assert FlatForest(approval_model).predict_positive(X).shape == (1,)
+
+
+async def test_prediction_batcher_scatters_rows_in_order():
+    batch_sizes = []
+
+    def predict_batch(X):
+        batch_sizes.append(len(X))
+        return [(float(row[0]), int(row[1])) for row in X]
+
+    batcher = PredictionBatcher(predict_batch, max_batch=4, max_wait_ms=50)
+    rows = [np.array([i / 10, i], dtype=np.float32) for i in range(10)]
+
+    results = await asyncio.gather(*(batcher.predict(row) for row in rows))
+    await batcher.close()
+
+    assert results == [(pytest.approx(i / 10), i) for i in range(10)]
+    assert batch_sizes == [4, 4, 2]
+
+
+async def test_prediction_batcher_propagates_errors_and_recovers():
+    def predict_batch(X):
+        if (X[:, 0] < 0).any():
+            raise ValueError("bad features")
+        return [(1.0, 0)] * len(X)
+
+    batcher = PredictionBatcher(predict_batch, max_batch=8, max_wait_ms=50)
+    bad = np.array([-1.0], dtype=np.float32)
+    good = np.array([1.0], dtype=np.float32)
+
+    results = await asyncio.gather(
+        batcher.predict(bad), batcher.predict(good), return_exceptions=True
+    )
+    assert [str(r) for r in results] == ["bad features"] * 2
+
+    assert await batcher.predict(good) == (1.0, 0)
+    await batcher.close()
+
+
+def test_model_artifact_round_trip(trained_processor, tmp_path):
+    path = tmp_path / "models" / "models.joblib"
+    trained_processor._save_model_artifact(path)
+
+    loaded = ClaimsProcessor()
+    assert loaded._load_model_artifact(path)
+
+    X = _features(200)
+    np.testing.assert_array_equal(
+        loaded.approval_model.predict_proba(X),
+        trained_processor.approval_model.predict_proba(X),
+    )
+    assert list(tmp_path.joinpath("models").iterdir()) == [path]
+
+
+def test_missing_or_stale_artifact_is_not_loaded(trained_processor, tmp_path):
+    path = tmp_path / "models.joblib"
+    assert not ClaimsProcessor()._load_model_artifact(path)
+
+    trained_processor._save_model_artifact(path)
+    artifact = claims_processor.joblib.load(path)
+    artifact["version"] -= 1
+    claims_processor.joblib.dump(artifact, path)
+
+    assert not ClaimsProcessor()._load_model_artifact(path)
+
+
+@pytest.mark.parametrize("keep_bytes", [0, 20, 5000])
+def test_corrupt_artifact_is_retrained_not_raised(
+    trained_processor, tmp_path, caplog, keep_bytes
+):
+    path = tmp_path / "models.joblib"
+    trained_processor._save_model_artifact(path)
+    path.write_bytes(path.read_bytes()[:keep_bytes])
+
+    loaded = ClaimsProcessor()
+    with caplog.at_level(logging.WARNING):
+        assert not loaded._load_model_artifact(path)
+
+    assert loaded.approval_model is None
+    assert "Unreadable model artifact" in caplog.text
+
+
+def test_world_writable_artifact_is_not_loaded(trained_processor, tmp_path):
+    path = tmp_path / "models.joblib"
+    trained_processor._save_model_artifact(path)
+    path.chmod(0o666)
+
+    assert not ClaimsProcessor()._load_model_artifact(path)
+
+
+def test_unwritable_artifact_path_only_warns(trained_processor, tmp_path, caplog):
+    blocker = tmp_path / "not-a-dir"
+    blocker.write_text("")
+
+    with caplog.at_level(logging.WARNING):
+        trained_processor._save_model_artifact(blocker / "models.joblib")
+
+    assert "Could not save models" in caplog.text
+    assert list(tmp_path.iterdir()) == [blocker]
+
+
+@pytest.mark.parametrize("ticks", [1, 2])
+async def test_prediction_batcher_close_fails_pending_predictions(ticks):
+    # After one tick the rows are still queued; after two the consumer holds
+    # them in a half-collected batch
+    calls = []
+    batcher = PredictionBatcher(calls.append, max_batch=8, max_wait_ms=60_000)
+    rows = [np.array([float(i)], dtype=np.float32) for i in range(3)]
+    tasks = [asyncio.create_task(batcher.predict(row)) for row in rows]
+    for _ in range(ticks):
+        await asyncio.sleep(0)
+
+    await batcher.close()
+
+    results = await asyncio.wait_for(asyncio.gather(*tasks, return_exceptions=True), 1)
+    assert [str(r) for r in results] == ["Prediction batcher closed"] * 3
+    assert calls == []
+    with pytest.raises(RuntimeError):
+        await batcher.predict(rows[0])
+
+
+async def test_prediction_batcher_does_not_linger_for_a_lone_row():
+    batcher = PredictionBatcher(
+        lambda X: [(1.0, 0)] * len(X), max_batch=8, max_wait_ms=60_000
+    )
+
+    result = await asyncio.wait_for(
+        batcher.predict(np.array([1.0], dtype=np.float32)), 1
+    )
+    await batcher.close()
+
+    assert result == (1.0, 0)
@@ -0,0 +1,308 @@
+"""Tests for compiled schema extractors and the FHIR reference loader."""
+
+import asyncio
+from datetime import datetime
+
+import pytest
+from pydantic import BaseModel
+
+from src.utils.fhir_converter import (
+    FHIRConverter,
+    FhirRefLoader,
+    FieldSpec,
+    SchemaSpec,
+    compile_extractor,
+)
+
+NOW = datetime(2024, 6, 1, 12, 0)
+
+SBS_CLAIM = {
+    "billing_standard": "SBS",
+    "claim_id": "SBS-1",
+    "claim_number": "CN-77",
+    "total_amount": "450.5",
+    "insurance_plan": "GOLD",
+    "policy_number": "POL-9",
+    "service_start_date": "2024-05-01",
+    "patient_info": {
+        "patient_id": "P-1",
+        "national_id": "1012345678",
+        "name_en": "Ahmed Ali",
+        "name_ar": "أحمد علي",
+        "date_of_birth": "1980-02-03",
+        "gender": "male",
+        "insurance_number": "INS-5",
+    },
+    "provider_info": {
+        "provider_id": "PR-2",
+        "name_en": "Riyadh Clinic",
+        "license_number": "LIC-3",
+        "nphies_id": "NPH-4",
+    },
+    "primary_diagnosis": {"code": "J06.9", "description": "URTI"},
+    "billing_items": [
+        {
+            "line_number": "2",
+            "quantity": 3,
+            "unit_price": "100",
+            "total_amount": 300,
+            "procedure_code": "99213",
+            "procedure_description": "Visit",
+            "service_date": "2024-05-02",
+        },
+        {"procedure_code": "85025"},
+    ],
+}
+
+
+def test_sbs_conversion_maps_every_field():
+    claim = FHIRConverter()._convert_sbs_to_claim(SBS_CLAIM, NOW)
+
+    assert claim.model_dump() == {
+        "id": "SBS-1",
+        "tenant_id": "default",
+        "claim_number": "CN-77",
+        "total_amount": 450.5,
+        "insurance_plan": "GOLD",
+        "policy_number": "POL-9",
+        "patient": {
+            "id": "P-1",
+            "national_id": "1012345678",
+            "name": "Ahmed Ali",
+            "arabic_name": "أحمد علي",
+            "date_of_birth": datetime(1980, 2, 3),
+            "gender": "male",
+            "insurance_id": "INS-5",
+        },
+        "provider": {
+            "id": "PR-2",
+            "name": "Riyadh Clinic",
+            "arabic_name": "",
+            "license_number": "LIC-3",
+            "specialty": "",
+            "nphies_provider_id": "NPH-4",
+        },
+        "items": [
+            {
+                "sequence": 2,
+                "quantity": 3,
+                "unit_price": 100.0,
+                "total_amount": 300.0,
+                "procedure_code": {
+                    "code": "99213",
+                    "display": "Visit",
+                    "arabic_display": "",
+                    "system": "SBS",
+                    "cost": 100.0,
+                },
+                "diagnosis_codes": [],
+                "service_date": datetime(2024, 5, 2),
+            },
+            {
+                "sequence": 1,
+                "quantity": 1,
+                "unit_price": 0.0,
+                "total_amount": 0.0,
+                "procedure_code": {
+                    "code": "85025",
+                    "display": "",
+                    "arabic_display": "",
+                    "system": "SBS",
+                    "cost": 0.0,
+                },
+                "diagnosis_codes": [],
+                "service_date": NOW,
+            },
+        ],
+        "primary_diagnosis": {
+            "code": "J06.9",
+            "system": "ICD-10",
+            "display": "URTI",
+            "arabic_display": "",
+        },
+        "secondary_diagnoses": [],
+        "service_period": {"start": datetime(2024, 5, 1), "end": NOW},
+    }
+
+
+def test_sbs_conversion_defaults_for_an_empty_claim():
+    claim = FHIRConverter()._convert_sbs_to_claim({"billing_standard": "SBS"}, NOW)
+
+    assert claim.id == claim.claim_number == claim.policy_number == ""
+    assert claim.total_amount == 0.0
+    assert claim.items == []
+    assert claim.patient.date_of_birth == datetime(1970, 1, 1)
+    assert claim.patient.gender == "unknown"
+    assert claim.provider.nphies_provider_id == ""
+    assert claim.primary_diagnosis.system == "ICD-10"
+    assert claim.service_period == {"start": NOW, "end": NOW}
+
+
+class Record(BaseModel):
+    name: str
+    city: str
+    zip_code: str
+    kind: str
+    count: int
+    tags: list
+    extra: str
+
+
+RECORD_SPEC = SchemaSpec(
+    Record,
+    (
+        FieldSpec("name", ("person", "name")),
+        FieldSpec("city", ("person", "address", "city"), "unknown"),
+        FieldSpec("zip_code", ("person", "address", "zip")),
+        FieldSpec("kind", (), "record"),
+        FieldSpec("count", ("count",), 0, int),
+        FieldSpec("tags", ("tags",), ("none",), list),
+    ),
+    params=("extra",),
+)
+
+
+def test_compile_extractor_reads_paths_defaults_and_params():
+    extract = compile_extractor(RECORD_SPEC)
+
+    full = extract(
+        {
+            "person": {"name": "Sara", "address": {"city": "Jeddah", "zip": "21411"}},
+            "count": "4",
+            "tags": ("a", "b"),
+        },
+        extra="x",
+    )
+    empty = extract({}, extra="y")
+
+    assert full.model_dump() == {
+        "name": "Sara",
+        "city": "Jeddah",
+        "zip_code": "21411",
+        "kind": "record",
+        "count": 4,
+        "tags": ["a", "b"],
+        "extra": "x",
+    }
+    assert empty.model_dump() == {
+        "name": "",
+        "city": "unknown",
+        "zip_code": "",
+        "kind": "record",
+        "count": 0,
+        "tags": ["none"],
+        "extra": "y",
+    }
+    assert compile_extractor(RECORD_SPEC) is extract
+
+
+@pytest.mark.parametrize(
+    "spec",
+    [
+        SchemaSpec(Record, (FieldSpec("name)", ("name",)),)),
+        SchemaSpec(Record, (FieldSpec("class", ("name",)),)),
+        SchemaSpec(Record, (FieldSpec("d", ("name",)),)),
+        SchemaSpec(Record, (FieldSpec("name", ("a", 1)),)),
+        SchemaSpec(Record, (), params=("import os",)),
+    ],
+)
+def test_compile_extractor_rejects_unsafe_specs(spec):
+    with pytest.raises(ValueError):
+        compile_extractor(spec)
+
+
+class CountingFetch:
+    def __init__(self, error: Exception | None = None):
+        self.calls = []
+        self.error = error
+        self.release = asyncio.Event()
+        self.release.set()
+
+    async def __call__(self, reference):
+        self.calls.append(reference)
+        await self.release.wait()
+        if self.error is not None:
+            raise self.error
+        return {"id": reference}
+
+
+async def test_ref_loader_caches_and_serves_hits_synchronously():
+    fetch = CountingFetch()
+    loader = FhirRefLoader(fetch)
+
+    assert loader.get_cached("Patient/1") is None
+    assert await loader.load("Patient/1") == {"id": "Patient/1"}
+    assert loader.get_cached("Patient/1") == {"id": "Patient/1"}
+    assert await loader.load_many(["Patient/1", "Patient/1"]) == {
+        "Patient/1": {"id": "Patient/1"}
+    }
+    assert fetch.calls == ["Patient/1"]
+
+
+async def test_ref_loader_dedupes_concurrent_fetches():
+    fetch = CountingFetch()
+    fetch.release.clear()
+    loader = FhirRefLoader(fetch)
+
+    tasks = [
+        asyncio.create_task(loader.load_many(["Patient/1", "Patient/2"])),
+        asyncio.create_task(loader.load("Patient/1")),
+    ]
+    await asyncio.sleep(0)
+    fetch.release.set()
+    many, one = await asyncio.gather(*tasks)
+
+    assert sorted(fetch.calls) == ["Patient/1", "Patient/2"]
+    assert many["Patient/2"] == {"id": "Patient/2"}
+    assert one == many["Patient/1"]
+
+
+async def test_ref_loader_expires_and_evicts(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr("src.utils.fhir_converter.time.monotonic", lambda: clock[0])
+    fetch = CountingFetch()
+    loader = FhirRefLoader(fetch, maxsize=2, ttl=10)
+
+    await loader.load_many(["a", "b"])
+    await loader.load("a")  # refresh a's LRU position
+    await loader.load("c")  # evicts b
+    assert loader.get_cached("b") is None
+    assert loader.get_cached("a") is not None
+
+    clock[0] += 10
+    assert loader.get_cached("a") is None
+    await loader.load("a")
+    assert fetch.calls == ["a", "b", "c", "a"]
+
+
+async def test_ref_loader_errors_reach_all_waiters_and_are_not_cached():
+    fetch = CountingFetch(error=LookupError("not found"))
+    fetch.release.clear()
+    loader = FhirRefLoader(fetch)
+
+    tasks = [asyncio.create_task(loader.load("Patient/9")) for _ in range(2)]
+    await asyncio.sleep(0)
+    fetch.release.set()
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+
+    assert [str(r) for r in results] == ["not found"] * 2
+    assert fetch.calls == ["Patient/9"]
+    fetch.error = None
+    assert await loader.load("Patient/9") == {"id": "Patient/9"}
+
+
+async def test_ref_loader_cancelled_caller_does_not_cancel_shared_fetch():
+    fetch = CountingFetch()
+    fetch.release.clear()
+    loader = FhirRefLoader(fetch)
+
+    cancelled = asyncio.create_task(loader.load("Patient/1"))
+    waiting = asyncio.create_task(loader.load("Patient/1"))
+    await asyncio.sleep(0)
+    cancelled.cancel()
+    await asyncio.sleep(0)
+    fetch.release.set()
+
+    assert await waiting == {"id": "Patient/1"}
+    assert cancelled.cancelled()
+    assert fetch.calls == ["Patient/1"]
@@ -0,0 +1,129 @@
+"""Tests for the HIPAA audit middleware."""
+
+from types import SimpleNamespace
+
+import pytest
+from fastapi import Depends, FastAPI, HTTPException, Request
+from fastapi.testclient import TestClient
+
+from src.brainsait.hipaa_compliance import (
+    PHI_ROUTE_KEY,
+    HIPAAAuditMiddleware,
+    register_runtime_compliance_check,
+)
+from src.brainsait.hipaa_compliance import middleware
+
+
+def _acting_user(request: Request) -> SimpleNamespace:
+    request.state.user = SimpleNamespace(id="user-7")
+    return request.state.user
+
+
+def _build_app() -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(HIPAAAuditMiddleware)
+
+    @app.get("/phi/ok", openapi_extra={PHI_ROUTE_KEY: True})
+    async def phi_ok(user=Depends(_acting_user)):
+        return {"ok": True}
+
+    @app.get("/phi/boom", openapi_extra={PHI_ROUTE_KEY: True})
+    async def phi_boom(user=Depends(_acting_user)):
+        raise RuntimeError("database down")
+
+    @app.get("/phi/forbidden", openapi_extra={PHI_ROUTE_KEY: False})
+    async def phi_forbidden(user=Depends(_acting_user)):
+        raise HTTPException(status_code=403, detail="nope")
+
+    @app.get("/phi/items/{item_id}", openapi_extra={PHI_ROUTE_KEY: True})
+    async def phi_item(item_id: int):
+        return {"item_id": item_id}
+
+    @app.get("/public/boom")
+    async def public_boom():
+        raise RuntimeError("not audited")
+
+    return app
+
+
+@pytest.fixture
+def audits(monkeypatch):
+    records = []
+    monkeypatch.setattr(
+        middleware, "audit_log", lambda **record: records.append(record)
+    )
+    return records
+
+
+@pytest.fixture
+def checks():
+    calls = []
+
+    async def runtime_check():
+        calls.append(True)
+
+    register_runtime_compliance_check(runtime_check)
+    yield calls
+    register_runtime_compliance_check(None)
+
+
+@pytest.fixture
+def client():
+    return TestClient(_build_app(), raise_server_exceptions=False)
+
+
+def test_successful_tagged_request_is_checked_not_audited(client, audits, checks):
+    assert client.get("/phi/ok").status_code == 200
+
+    assert checks == [True]
+    assert audits == []
+
+
+def test_exception_is_audited_with_the_request_user(client, audits, checks):
+    assert client.get("/phi/boom").status_code == 500
+
+    assert audits == [
+        {
+            "action": "exception",
+            "user_id": "user-7",
+            "resource_type": "API",
+            "resource_id": "phi_boom",
+            "phi_involved": True,
+            "meta": {"error": "database down"},
+        }
+    ]
+
+
+def test_error_responses_are_audited_separately(client, audits, checks):
+    assert client.get("/phi/forbidden").status_code == 403
+    assert client.get("/phi/items/not-a-number").status_code == 422
+
+    assert [(a["action"], a["resource_id"], a["meta"]) for a in audits] == [
+        ("error_response", "phi_forbidden", {"status": 403}),
+        ("error_response", "phi_item", {"status": 422}),
+    ]
+    assert audits[0]["phi_involved"] is False
+    # Request validation fails before any dependency sets the user
+    assert audits[1]["user_id"] == "unknown"
+
+
+def test_untagged_routes_pass_through(client, audits, checks):
+    assert client.get("/public/boom").status_code == 500
+    assert client.get("/missing").status_code == 404
+
+    assert checks == []
+    assert audits == []
+
+
+def test_failed_runtime_check_blocks_the_request(client, audits):
+    async def failing_check():
+        raise RuntimeError("audit sink unavailable")
+
+    register_runtime_compliance_check(failing_check)
+    try:
+        response = client.get("/phi/ok")
+    finally:
+        register_runtime_compliance_check(None)
+
+    assert response.status_code == 500
+    assert audits == []